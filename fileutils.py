@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+'''
+Module of the file helpers shared by revamp1804.py and gdm3css.py: copying
+files and directory trees only when they differ, and replacing the content of
+a file atomically and durably.
+'''
+from pathlib import Path
+from shutil import copy2, rmtree
+import hashlib
+import os
+import stat
+
+
+def sync_tree( src, dst, checksum=False, keep=() ):
+    '''Function to make directory "dst" a copy of directory "src", like rsync.
+    Files are compared with sync_file(). Files and directories under "dst"
+    that are not in "src" are deleted, except the paths, relative to "dst",
+    listed in "keep". The tree is walked iteratively with os.scandir().
+    Symlinks in "src" are followed: the file or directory a symlink points
+    to is copied. A symlink that leads back into a directory being walked,
+    or to nothing, is skipped.
+    Returns the number of files copied and of stale items deleted.'''
+    src, dst = Path( src ), Path( dst )
+    keep = { Path( k ) for k in keep }
+    keep |= { parent for k in keep for parent in k.parents }
+    copied = deleted = 0
+    src_stat = src.stat()
+    ancestors = { Path(): { ( src_stat.st_dev, src_stat.st_ino ) } } # rel -> (dev, ino) of it and its parents
+    stack = [ Path() ]
+    while stack:
+        rel = stack.pop()
+        ddir = dst / rel
+        if ddir.is_symlink() or ( ddir.exists() and not ddir.is_dir() ):
+            ddir.unlink()
+        ddir.mkdir( parents=True, exist_ok=True )
+        names = set()
+        with os.scandir( str( src / rel ) ) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    entry_stat = entry.stat()
+                    inode = ( entry_stat.st_dev, entry_stat.st_ino )
+                    if inode in ancestors[ rel ]: #a symlink loop
+                        continue
+                    names.add( entry.name )
+                    ancestors[ rel / entry.name ] = ancestors[ rel ] | { inode }
+                    stack.append( rel / entry.name )
+                elif entry.is_file():
+                    names.add( entry.name )
+                    if sync_file( entry.path, ddir / entry.name, checksum, entry.stat() ):
+                        copied += 1
+        with os.scandir( str( ddir ) ) as entries:
+            for entry in entries:
+                if entry.name in names or rel / entry.name in keep:
+                    continue
+                if entry.is_dir( follow_symlinks=False ):
+                    rmtree( entry.path )
+                else:
+                    os.unlink( entry.path )
+                deleted += 1
+    return copied, deleted
+
+
+def sync_file( src, dst, checksum=False, src_stat=None ):
+    '''Function to copy file "src" to "dst" only if they differ. Files of the
+    same size and modification time are taken as equal; with "checksum", files
+    of the same size are compared by sha256 instead. The copy is written to a
+    temporary file that is then renamed over "dst". Returns True if it copied.'''
+    src, dst = Path( src ), Path( dst )
+    src_stat = src_stat or src.stat()
+    try:
+        dst_stat = dst.lstat()
+    except FileNotFoundError:
+        dst_stat = None
+    if dst_stat and stat.S_ISDIR( dst_stat.st_mode ):
+        rmtree( dst )
+        dst_stat = None
+    if dst_stat and stat.S_ISREG( dst_stat.st_mode ) and dst_stat.st_size == src_stat.st_size:
+        if not checksum and dst_stat.st_mtime_ns == src_stat.st_mtime_ns:
+            return False
+        if checksum and file_sha256( src ) == file_sha256( dst ):
+            if dst_stat.st_mtime_ns != src_stat.st_mtime_ns:
+                os.utime( str(dst), ns=( src_stat.st_atime_ns, src_stat.st_mtime_ns ) )
+            return False
+    tmp = dst.with_name( f'.{dst.name}.{os.getpid()}.tmp' )
+    try:
+        copy2( str(src), str(tmp) )
+        atomic_replace( tmp, dst )
+    except BaseException:
+        if tmp.exists():
+            tmp.unlink()
+        raise
+    return True
+
+
+def atomic_write( path, data ):
+    '''Function to replace the content of file "path" with "data", a str or
+    bytes object, atomically and durably: data is written to a temporary file
+    in the same directory, fsynced and renamed over "path". An existing file
+    keeps its permissions; a new one gets the default permissions of the
+    umask. Nothing is written when "path" already holds exactly "data".
+    Returns True if the file was written.'''
+    path = Path( path )
+    if isinstance( data, str ):
+        data = data.encode( 'utf-8' )
+    try:
+        if path.stat().st_size == len( data ) and path.read_bytes() == data:
+            return False
+        mode = stat.S_IMODE( path.stat().st_mode )
+    except FileNotFoundError:
+        mode = None
+    tmp = path.with_name( f'.{path.name}.{os.getpid()}.{os.urandom(4).hex()}.tmp' )
+    fd = os.open( str(tmp), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666 ) #the umask applies
+    try:
+        with os.fdopen( fd, 'wb' ) as file:
+            file.write( data )
+        if mode is not None:
+            os.chmod( str(tmp), mode )
+        atomic_replace( tmp, path )
+    except BaseException:
+        if tmp.exists():
+            tmp.unlink()
+        raise
+    return True
+
+
+def atomic_replace( tmp, path ):
+    '''Function to fsync the complete file "tmp", rename it over "path" and
+    fsync their directory, so that "path" holds either its old or its new
+    content after a crash.'''
+    fd = os.open( str(tmp), os.O_RDONLY )
+    try:
+        os.fsync( fd )
+    finally:
+        os.close( fd )
+    os.replace( str(tmp), str(path) )
+    fd = os.open( str( Path( path ).parent ), os.O_RDONLY )
+    try:
+        os.fsync( fd )
+    finally:
+        os.close( fd )
+
+
+def file_sha256( path ):
+    '''Function to return the sha256 hexdigest of the file at "path", read
+    in chunks.'''
+    sha256 = hashlib.sha256()
+    with open( str(path), 'rb' ) as file:
+        for chunk in iter( lambda: file.read( 64 * 1024 ), b'' ):
+            sha256.update( chunk )
+    return sha256.hexdigest()
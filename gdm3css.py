@@ -87,18 +87,200 @@ $ sudo python3.6 gdm3css.py --remove <path to where the GDM CSS file that is to
 
 '''
 from pathlib import Path, PosixPath
-from shutil import copy2, copytree, SameFileError, rmtree
-from subprocess import run, PIPE
+from shutil import copy2, rmtree
+from subprocess import run
 import argparse
 import json
 import mimetypes
+import os
 import sys
 
+from fileutils import atomic_write, sync_file, sync_tree
+
 
 class CSSFileTypeError(Exception):
     pass
 
 
+class Alternatives:
+    '''Class to model a Debian alternatives group, e.g. gdm3.css, in memory.
+
+    The group is read natively, on first access, from its admin file in
+    "admindir" and its symlink in "altdir"; no subprocess is needed to query
+    it. The mutation methods run update-alternatives and then update the
+    model in place. The admin file is read again only when something else
+    changes it.
+
+    Arguments:
+      name     - name of the alternatives group.
+      admindir - directory of the admin files, default /var/lib/dpkg/alternatives.
+      altdir   - directory of the alternatives symlinks, default /etc/alternatives.
+
+    Attributes:
+      query        - the group in the format of "update-alternatives --query <name>", stored in a list.
+      link         - path of the group's link.
+      status       - whether "manual" or "auto" mode is used to select the alternative.
+      best         - alternative that auto mode selects.
+      value        - selected alternative.
+      alternatives - dict of each alternative path to its priority.
+      max          - maximum priority of all the alternatives.
+
+    User Methods:
+      has     - whether a path is an alternative of the group.
+      install - install an alternative ( update-alternatives --install ).
+      remove  - remove an alternative ( update-alternatives --remove ).
+      auto    - select the alternative in auto mode ( update-alternatives --auto ).
+      set     - select an alternative in manual mode ( update-alternatives --set ).
+    '''
+    ADMINDIR = Path( '/var/lib/dpkg/alternatives' )
+    ALTDIR = Path( '/etc/alternatives' )
+
+    def __init__( self, name, admindir=None, altdir=None ):
+        self.name = name
+        self.admindir = Path( admindir ) if admindir else Alternatives.ADMINDIR
+        self.altdir = Path( altdir ) if altdir else Alternatives.ALTDIR
+        self._loaded = False
+        self._stamp = None
+        self._link = None
+        self._status = None
+        self._value = None
+        self._alternatives = {}
+
+    def _admin_stamp( self ):
+        try:
+            stat = ( self.admindir / self.name ).stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_ino, stat.st_size
+
+    def _load( self ):
+        stamp = self._admin_stamp()
+        if self._loaded and stamp == self._stamp:
+            return
+        self._stamp = stamp
+        self._loaded = True
+        self._link = self._status = self._value = None
+        self._alternatives = {}
+        if stamp is None:
+            return #group does not exist
+        #Admin file: status, link, pairs of slave name and slave link up to an
+        #empty line, then per alternative: path, priority and one line per
+        #slave, up to an empty line.
+        with open( self.admindir / self.name, 'r' ) as file:
+            lines = file.read().split( '\n' )
+        self._status = lines[0]
+        self._link = Path( lines[1] )
+        i = 2
+        nslaves = 0
+        while lines[i]:
+            nslaves += 1
+            i += 2
+        i += 1
+        while i < len( lines ) and lines[i]:
+            self._alternatives[ Path( lines[i] ) ] = int( lines[i+1] )
+            i += 2 + nslaves
+        try:
+            self._value = Path( os.readlink( str( self.altdir / self.name ) ) )
+        except OSError:
+            self._value = None
+
+    def _mutated( self ):
+        '''Record the admin file written by our own mutation as current.'''
+        self._stamp = self._admin_stamp()
+
+    def _update_alternatives( self, *args ):
+        '''Run update-alternatives; raise CalledProcessError if it fails, so
+        the model is only updated when dpkg's records are.'''
+        cmd = [ 'update-alternatives' ]
+        if self.admindir != Alternatives.ADMINDIR:
+            cmd += [ '--admindir', str(self.admindir) ]
+        if self.altdir != Alternatives.ALTDIR:
+            cmd += [ '--altdir', str(self.altdir) ]
+        run( cmd + [ str(arg) for arg in args ], check=True )
+
+    @property
+    def query( self ):
+        self._load()
+        if self._status is None:
+            return []
+        query = [ f'Name: {self.name}', f'Link: {self._link}', f'Status: {self._status}',
+                  f'Best: {self.best}', f'Value: {self._value or "none"}' ]
+        for alternative, priority in self._alternatives.items():
+            query += [ '', f'Alternative: {alternative}', f'Priority: {priority}' ]
+        return query
+
+    @property
+    def link( self ):
+        self._load()
+        return self._link
+
+    @property
+    def status( self ):
+        self._load()
+        return self._status
+
+    @property
+    def alternatives( self ):
+        self._load()
+        return self._alternatives
+
+    @property
+    def best( self ):
+        '''First alternative with the highest priority, as update-alternatives chooses.'''
+        self._load()
+        if not self._alternatives:
+            return None
+        return max( self._alternatives, key=self._alternatives.get )
+
+    @property
+    def value( self ):
+        self._load()
+        return self._value
+
+    @property
+    def max( self ):
+        self._load()
+        return max( self._alternatives.values(), default=0 )
+
+    def has( self, path ):
+        return Path( path ) in self.alternatives
+
+    def install( self, link, path, priority ):
+        self._load()
+        self._update_alternatives( '--install', link, self.name, path, priority )
+        self._link = Path( link )
+        self._alternatives[ Path( path ) ] = priority
+        if self._status is None:
+            self._status = 'auto'
+        if self._status == 'auto':
+            self._value = self.best
+        self._mutated()
+
+    def remove( self, path ):
+        self._load()
+        self._update_alternatives( '--remove', self.name, path )
+        self._alternatives.pop( Path( path ), None )
+        if self._value == Path( path ):
+            self._status = 'auto' #update-alternatives falls back to auto mode
+        if self._status == 'auto':
+            self._value = self.best
+        self._mutated()
+
+    def auto( self ):
+        self._load()
+        self._update_alternatives( '--auto', self.name )
+        self._status = 'auto'
+        self._value = self.best
+        self._mutated()
+
+    def set( self, path ):
+        self._load()
+        self._update_alternatives( '--set', self.name, path )
+        self._status = 'manual'
+        self._value = Path( path )
+        self._mutated()
+
+
 class GDM3css:
     '''Class to query, load, install and remove a Ubuntu 18.04 GNOME Display
        Manager(GDM) Theme.
@@ -108,9 +290,11 @@ class GDM3css:
       remove  - path of the GDM CSS file that you want to remove.
       
     Attributes:
-      install - same as above.
-      remove  - same as above.
-      query   - stdout from cmdline "update-alternatives --query gdm3.css" stored in a list.
+      install      - same as above.
+      remove       - same as above.
+      alternatives - the gdm3.css Alternatives group; it is only read when
+                     one of the below attributes is first used.
+      query   - gdm3.css group in the format of cmdline "update-alternatives --query gdm3.css" stored in a list.
       link    - path of gdm3.css.
       best    - alternative path of gdm3.css if selected by auto mode.
       value   - selected alternative path of gdm3.css .
@@ -126,74 +310,39 @@ class GDM3css:
     GNOME_SHELL_THEME = Path( '/usr/share/gnome-shell/theme' )
     
     #Class Methods
-    def __init__( self, install=None, remove=None,  ) :
-
-        def _get( qvalue ):
-            return Path( [ line[ line.index('/') : ] for line in self.query if qvalue in line ][0] )
-
+    def __init__( self, install=None, remove=None, alternatives=None ) :
         self.install = install #<class 'pathlib.PosixPath'>
         self.remove = remove   #<class 'pathlib.PosixPath'>
-        self.query = run( [ 'update-alternatives', '--query', 'gdm3.css' ],
-                          stdout=PIPE, encoding="utf-8" ).stdout.splitlines() #<class 'list'>
-        self.link   = _get( 'Link:' )  #<class 'pathlib.PosixPath'>
-        self.best   = _get( 'Best:' )  #<class 'pathlib.PosixPath'>
-        self.value  = _get( 'Value:' ) #<class 'pathlib.PosixPath'>
-        self.status = [ line[ line.index(':')+2 : ] for line in self.query if 'Status:' in line ][0] #<class 'str'>
-        self.max = max( [ int( line[ line.index(':')+1 : ] ) for line in self.query if 'Priority:' in line ] ) #<class 'int'>
+        self.alternatives = alternatives or Alternatives( 'gdm3.css' )
         print()
         #if install:
         #    print( f'self.install = {self.install} {type(self.install)}' )  #For debugging
         #if remove:
         #    print( f'self.remove = {self.remove} {type(self.remove)}' )  #For debugging
-        #if install is None and remove is None:
-        #print( f'self.query ={self.query} {type(self.query)}' )   #For debugging
-        #print( f'self.link  ={self.link} {type(self.link)}' )     #For debugging
-        #print( f'self.best  ={self.best} {type(self.best)}' )     #For debugging
-        #print( f'self.value ={self.value} {type(self.value)}' )   #For debugging
-        #print( f'self.status={self.status} {type(self.status)}' ) #For debugging
-        #print( f'self.max   ={self.max} {type(self.max)}' )       #For debugging
-
-
-    def _path(self, tgt):
-        '''Method to take in only str() and pathlib.Path() objects and ensure
-        that only a pathlib.Path() object is returned.'''
-        if isinstance( tgt, str ):
-            return Path( tgt )
-        elif isinstance( tgt, Path ):
-            return tgt
-        else:
-            raise TypeError( f'{tgt} must be a str() or pathlib.Path() object.' )
-        
 
-    def _recursive_overwrite(self, src, dst):
-        '''Method to recursively copy item(s) from src to dst. If the item
-        exist, it will be overwritten.'''
-        #print( f'\ndef _recursive_overwrite(self, src, dst):' )
-        #print( f'src={src}' )
-        #print( f'dst={dst}' )
-        src = self._path( src ) #ensure src is a pathlib.Path() object
-        dst = self._path( dst ) #ensure dst is a pathlib.Path() object
-        if src.is_dir():
-            #print( f'if src.is_dir():' )
-            if not dst.is_dir():
-                dst.mkdir()
-            files = [ x for x in src.iterdir() ]
-            #print( f'files = {files}' )
-            for f in files:
-                #print( f'\nf = {f}' )
-                #print( f'f.name = {f.name}' )
-                #print( f'src.joinpath( f.name ) = {src.joinpath( f.name )}')
-                #print( f'dst.joinpath( f.name ) = {dst.joinpath( f.name )}')
-                self._recursive_overwrite(
-                    str( src.joinpath( f.name ) ), str( dst.joinpath( f.name ) ) )
-        else:
-            #print( f'else:' )
-            try:
-                #print( f'copy2( {src}, {dst} )' )
-                copy2( src, dst )
-            except SameFileError:
-                #print( f'except SameFileError:' )
-                src.replace( dst )
+    @property
+    def query( self ):
+        return self.alternatives.query   #<class 'list'>
+
+    @property
+    def link( self ):
+        return self.alternatives.link    #<class 'pathlib.PosixPath'>
+
+    @property
+    def best( self ):
+        return self.alternatives.best    #<class 'pathlib.PosixPath'>
+
+    @property
+    def value( self ):
+        return self.alternatives.value   #<class 'pathlib.PosixPath'>
+
+    @property
+    def status( self ):
+        return self.alternatives.status  #<class 'str'>
+
+    @property
+    def max( self ):
+        return self.alternatives.max     #<class 'int'>
 
 
     def _is_gdm3css_alternative( self, src ):
@@ -202,7 +351,7 @@ class GDM3css:
         #print( f'src = {src} {type(src)}' )
         if 'css' not in mimetypes.guess_type( str(src) )[0] :
             raise CSSFileTypeError( f'{src} is not a CSS file.' )
-        result = True in [ True for line in self.query if str(src) in line ]
+        result = self.alternatives.has( src )
         #print( f'result = {result}' )
         return result
 
@@ -212,12 +361,11 @@ class GDM3css:
         CSS file path relative to /usr/share/gnome-shell/theme. Argument "value"
         must be a str object.'''
         #print( f'\ndef _update_ubuntujson( self, value ):' )
-        with open( '/usr/share/gnome-shell/modes/ubuntu.json', "r+" ) as file:
+        ubuntujson = '/usr/share/gnome-shell/modes/ubuntu.json'
+        with open( ubuntujson, "r" ) as file:
             data = json.load( file )
-            data[ "stylesheetName" ] = value
-            file.seek( 0 )  # rewind
-            json.dump( data, file, indent=4 )
-            file.truncate()
+        data[ "stylesheetName" ] = value
+        atomic_write( ubuntujson, json.dumps( data, indent=4 ) )
 
 
     def load_files( self ):
@@ -228,28 +376,32 @@ class GDM3css:
         #print( f'src={src} {type(src)}')
         #print( f'dst={dst} {type(dst)}' )  #For debugging
 
-        #1. Load GDM Cascading Style Sheet and its associate files
-        try:
-            #print( 'copytree( src, dst )' )
-            copytree( src, dst )
-        except FileExistsError:
-            print( 'FileExistsError:' )
-            self._recursive_overwrite( src, dst )
+        #1. Load GDM Cascading Style Sheet and its associate files; only
+        #   changed files are copied and stale ones are removed.
+        lockdialoggroup = Path( 'assets' ) / 'lockDialogGroup.jpg'
+        copied, deleted = sync_tree( src, dst, keep=[ lockdialoggroup ] )
+        print( f'{dst}: {copied} file(s) copied, {deleted} stale item(s) removed.' )
 
         #2. Place wallpaper of unlockscreen and loginscreen wallpaper in gnome-shell/theme
-        #   -- it is read by revamp1804.css
-        sierra = Path().home()/'.local'/'share'/'backgrounds'/'Sierra-wallpapers'/'Sierra2.jpg'
+        #   -- it is read by revamp1804.css. Prefer the screen-sized image
+        #   derived by revamp1804.py over the full-size Sierra wallpaper.
+        backgrounds = Path().home()/'.local'/'share'/'backgrounds'
+        derived = backgrounds/'lockDialogGroup.jpg'
+        sierra = backgrounds/'Sierra-wallpapers'/'Sierra2.jpg'
         warty = Path( '/usr/share/backgrounds/warty-final-ubuntu.png' )
-        dst1 = dst/'assets'/'lockDialogGroup.jpg'
+        dst1 = dst / lockdialoggroup
         #print( f'sierra={sierra} {type(sierra)}' )  #For debugging
         #print( f'warty={warty} {type(warty)}' )  #For debugging
         #print( f'dst1={dst1} {type(dst1)}' )  #For debugging
         #print( f'sierra.exists()={sierra.exists()} {type(sierra.exists())}' )  #For debugging
-        if sierra.exists():
-            copy2( sierra, dst1 ) #Use Sierra theme wallpaper
+        if derived.exists():
+            sync_file( derived, dst1 ) #Use derived Sierra theme wallpaper
+            print('#Using derived Sierra theme wallpaper')
+        elif sierra.exists():
+            sync_file( sierra, dst1 ) #Use Sierra theme wallpaper
             print('#Using Sierra theme wallpaper')
         else:
-            copy2( warty, dst1 ) #Use Ubuntu18.04 default wallpaper
+            sync_file( warty, dst1 ) #Use Ubuntu18.04 default wallpaper
             print('#Using Ubuntu18.04 default wallpaper')
 
 
@@ -258,9 +410,10 @@ class GDM3css:
            and be used in /usr/share/gnome-shell/modes/ubuntu.json.
         '''
         def _config_alternatives( tgt ):
-            if 'auto' not in self.status:
-                run( ['update-alternatives', '--auto', 'gdm3.css' ] ) #Ensure auto mode is used
-            run( [ 'update-alternatives', '--install', self.link, 'gdm3.css', tgt, str(self.max + 1) ] )
+            if self.status and 'auto' not in self.status:
+                self.alternatives.auto() #Ensure auto mode is used
+            link = self.link or GDM3css.GNOME_SHELL_THEME / 'gdm3.css'
+            self.alternatives.install( link, tgt, self.max + 1 )
             print( f'{tgt} is now gdm3.css alternative.' )
 
         css = GDM3css.GNOME_SHELL_THEME / self.install.relative_to( self.install.parents[1] )
@@ -280,12 +433,11 @@ class GDM3css:
             #print( f'if not self._is_gdm3css_alternative( css ):' )
             _config_alternatives( css )
             pass
-        elif self.value.samefile( css ):
+        elif self.value is not None and self.value.samefile( css ):
             print( f'{css} is already a gdm3.css alternative.' )
         else:
             #print( f'else' )
-            run( [ 'update-alternatives', '--remove', 'gdm3.css', str(css) ] )
-            self.__init__( install=self.install )
+            self.alternatives.remove( css )
             _config_alternatives( css )
 
         #3. Reflect it /usr/share/gnome-shell/modes/ubuntu.json
@@ -316,13 +468,12 @@ class GDM3css:
         #3. Remove the CSS file of the theme that is to be removed from the
         #   Debian alternatives system and revert to using
         #   /usr/share/gnome-shell/theme/ubuntu.css 
-        run( [ 'update-alternatives', '--remove', 'gdm3.css', str(self.remove) ] )
-        run( [ 'update-alternatives', '--auto', 'gdm3.css' ] ) #Ensure auto mode is used
-        self.__init__( remove=self.remove )
+        self.alternatives.remove( self.remove )
+        self.alternatives.auto() #Ensure auto mode is used
         #   If auto mode does not select usr/share/gnome-shell/theme/ubuntu.css,
         #   then set it manually.
-        if not self.value.samefile( ubuntu ):  
-            run( [ 'update-alternatives', '--set', 'gdm3.css', str(ubuntu) ] )
+        if self.value is None or not self.value.samefile( ubuntu ):  
+            self.alternatives.set( ubuntu )
         #4. Remove the selected theme directory from directory
         #   /usr/share/gnome-shell/theme. E.g. if selected them is at
         #   /usr/share/gnome-shell/theme/mytheme/mytheme.css, we want to
@@ -399,6 +550,7 @@ def main():
     if args.install is None and args.remove is None :
         print('QUERY')
         gdm3 = GDM3css()
+        print( '\n'.join( gdm3.query ) or 'gdm3.css has no alternatives.' )
     elif args.install and args.remove is None :
         #print('INSTALL')
         #print( f'type(args.install) = {type(args.install)}' )
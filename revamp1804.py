@@ -29,22 +29,34 @@ Tasks:
       screensaver wallpapers.
 '''
 import argparse
+import base64
 import getpass
+import hashlib
+import json
 import os
 import platform
+import random
+import re
+import resource
+import stat
+import subprocess
 import sys
 import time
-import concurrent.futures as cf
+from contextlib import contextmanager
+from fnmatch import fnmatchcase
+from html import escape
 from io import BytesIO
 from itertools import repeat
 from json import loads as jsonloads
 from pathlib import Path
-from shutil import copy2, copytree, rmtree
-from subprocess import run, PIPE, STDOUT, CalledProcessError
-from threading import current_thread
-from urllib.request import Request, urlopen
-from urllib.error import URLError
-from zipfile import ZipFile
+from shutil import copy2, copyfileobj, copytree, rmtree, which
+from subprocess import DEVNULL, PIPE, STDOUT, CalledProcessError
+from tempfile import mkdtemp, NamedTemporaryFile, TemporaryDirectory
+from threading import BoundedSemaphore, current_thread, local, Lock
+from urllib.error import HTTPError, URLError
+from urllib.parse import unquote, urljoin, urlsplit
+
+from fileutils import atomic_replace, atomic_write, file_sha256, sync_file
 
 #=================
 # Global Variables
@@ -58,28 +70,9 @@ __maintainer__ = "sunbearc22"
 __email__ = "sunbear.c22@gmail.com"
 __status__ = "Development"
 
-# Directories
-HOME = Path.home() #user home directory
-INSTALLER_DIR = Path().absolute()
-print( f'INSTALLER_DIR = {INSTALLER_DIR}')
-if os.getuid() == 0:
-    sys.exit( print( f'\nQuit: Don\'t run this script with \'sudo\' privilege.\n'
-                     '      Re-run this script as normal user.' ) )
-else:
-    GLIB2_SCHEMAS = HOME/'.local'/'share'/'glib-2.0'/'schemas'
-    GSEXTENSIONS = HOME/'.local'/'share'/'gnome-shell'/'extensions'
-    ICONS = HOME/'.local'/'share'/'icons'
-    FONTS = HOME/'.local'/'share'/'fonts'
-    THEMES = HOME/'.local'/'share'/'themes'
-    BACKGROUNDS = HOME/'.local'/'share'/'backgrounds'
-    GBACKGROUNDS_PROPERTIES =  HOME/'.local'/'share'/'gnome-background-properties'
-for _folder in [ GLIB2_SCHEMAS, GSEXTENSIONS, ICONS, FONTS, THEMES, BACKGROUNDS,
-                 GBACKGROUNDS_PROPERTIES ]:
-    if not _folder.exists() and not _folder.is_dir():
-        _folder.mkdir( mode=0o777, parents=True, exist_ok=False )
+# Directories -- see class Config; they are computed when first used.
 
 # Variables
-USERNAME = getpass.getuser() # Get OS username
 PPA = ['ppa:dyatlov-igor/sierra-theme']
 GNOME_DEB_PKGS = [ 
     'dconf-editor', 'gnome-tweak-tool', #Utilities to configure GNOME and GNOME shell 
@@ -93,6 +86,7 @@ GNOME_DEB_PKGS = [
     'idle-python3.6',  #Allow user to edit and test this python script
     'libqt5svg5', 'qml-module-qtquick-controls', #For MacOS MOD cursor 
     'libreoffice-style-sifr',# "sifr" symbol style (an adaption of the Gnome symbolic theme), to manually enable in LibreOffice --> Tools --> Option --> LibreOffice --> View --Icon Style.
+    'python3-pil', #Pillow, to derive and pre-scale the wallpapers in-process instead of with ImageMagick's convert
     ]
 REMOVE_DEB_PKGS = [ 
     'gnome-shell-extension-dashtodock', #GNOME shell dash-to-dock extension
@@ -101,6 +95,1109 @@ REMOVE_DEB_PKGS = [
     #'xdotool', #Needed to programmatically simulate keyboard input Alt+F2 followed by r + Return to restart GNOME shell.
     'libreoffice-style-sifr',# "sifr" symbol style (an adaption of the Gnome symbolic theme), to manually enable in LibreOffice --> Tools --> Option --> LibreOffice --> View --Icon Style.
     ]
+CHUNK_SIZE = 64 * 1024          # bytes read from a download stream at a time
+MEMORY_CEILING = 8 * 1024**2    # bytes of a download that may be held in RAM before it is spooled to disk
+GLIB2_SCHEMAS_DIGEST = '.revamp1804-schemas.sha256'    # records the schemas the user schemas directory was compiled from
+GLIB2_SCHEMAS_INPUTS = ( '*.gschema.xml', '*.enums.xml', '*.gschema.override' ) # files glib-compile-schemas reads
+APT_TTL = 3600                  # seconds during which refreshed apt package lists are not updated again
+JOBS = 4                        # phases of install()/remove() that may run at the same time
+GSETTINGS_BATCH = None      # list of pending [schema, key, value] while a gsettings_batch() is open
+GSETTINGS_LOCK = Lock()
+HTTP_STREAMS_PER_HOST = 4      # downloads that may be in flight to one host at the same time
+HTTP_TIMEOUT = 30               # socket timeout in seconds of the download connections
+DOWNLOAD_RETRIES = 4            # times a failed or interrupted download is retried
+DOWNLOAD_BACKOFF = 1.0          # seconds before the first retry; doubled for every next one
+DOWNLOAD_BACKOFF_MAX = 30.0     # upper limit of the wait before a retry
+RETRY_STATUSES = ( 408, 429, 500, 502, 503, 504 ) # HTTP statuses worth retrying
+EXTRACT_JOBS = os.cpu_count() or 2  # threads that extract the members of the archives
+EXTRACT_MIN_MEMBERS = 64        # archives with fewer files are extracted by the calling thread alone
+EXTRACT_POOL = None             # ThreadPoolExecutor of extract_zip(), created when first needed
+EXTRACT_POOL_LOCK = Lock()
+# Members of the downloaded archives that are needed at runtime; patterns are
+# matched against the lower-cased member name, and "*" also matches "/". The
+# icons excludes are matched against the first two levels of the name only,
+# i.e. the top-level directory of the archive and an entry in it, so icons
+# named e.g. preview.svg deeper in the theme are kept; ICONS_EXCLUDE_ANYWHERE
+# is matched at any depth.
+ICONS_EXCLUDE = ( '*/readme*', '*/screenshot*', '*/preview*', '*/.git*' )
+ICONS_EXCLUDE_ANYWHERE = ( '*.md', )
+CURSORS_INCLUDE = ( '*/index.theme', '*/cursor.theme', '*/cursors/*' )
+FONTS_INCLUDE = ( '*.ttf', '*.otf', '*.ttc' )
+WALLPAPER_WIDTH = 1440          # width of derived wallpapers when no monitor geometry is known
+LOCKSCREEN_EFFECTS = { 'brightness': 0.9, 'contrast': 0.85, 'sigma': 30, 'quality': 95 } # blur sigma is for a WALLPAPER_WIDTH wide image
+WALLPAPER_FORMAT = 'jpeg'       # format of the pre-scaled wallpaper variants: 'jpeg' or 'webp'
+WALLPAPER_QUALITY = 90          # encoder quality of the pre-scaled wallpaper variants
+GNOME_SHELL_BUS_NAME = 'org.gnome.Shell'  # session bus name owned by GNOME Shell
+GNOME_SHELL_RESTART_TIMEOUT = 30  # seconds GNOME Shell may take to own its bus name again after a restart
+DOWNLOAD_ENGINE = 'threads'     # 'threads', or 'asyncio' for run_archives_asyncio()
+ASYNC_DOWNLOADS = 8             # archives the asyncio engine streams at the same time
+PROGRESS_INTERVAL = 0.5         # seconds between updates of the download progress line
+
+
+#=================
+# Classes
+#=================
+class lazyproperty:
+    '''Decorator of a method that computes an attribute when it is first
+    accessed and caches it in the instance, like functools.cached_property of
+    Python 3.8.'''
+
+    def __init__( self, func ):
+        self.func = func
+        self.__doc__ = func.__doc__
+
+    def __get__( self, instance, owner ):
+        if instance is None:
+            return self
+        value = instance.__dict__[ self.func.__name__ ] = self.func( instance )
+        return value
+
+
+class Config:
+    '''Class to provide the directories and user details used by Revamp 18.04.
+    Each is computed when it is first used, so importing this module has no
+    side effects. No directory is created here; the phases that write into
+    one create it with makedirs().
+
+    Attributes:
+      home                    - user home directory.
+      installer_dir           - directory revamp1804.py is run from.
+      username                - OS username.
+      glib2_schemas           - user GSettings schemas directory.
+      gsextensions            - user GNOME Shell extensions directory.
+      icons, fonts, themes    - user icons, fonts and themes directories.
+      backgrounds             - user wallpapers directory.
+      gbackgrounds_properties - user GNOME Wallpaper Picker directory.
+      wallpaper_variants_dir  - wallpapers pre-scaled for the monitors.
+      cache_dir               - downloads and derived images; $XDG_CACHE_HOME.
+      config_dir              - settings shared with the nautilus script; $XDG_CONFIG_HOME.
+      state_dir               - journal of --resume; $XDG_STATE_HOME.
+    '''
+
+    @lazyproperty
+    def home( self ):
+        return Path.home()
+
+    @lazyproperty
+    def installer_dir( self ):
+        return Path().absolute()
+
+    @lazyproperty
+    def username( self ):
+        return getpass.getuser()
+
+    @lazyproperty
+    def local_share( self ):
+        return self.home/'.local'/'share'
+
+    @lazyproperty
+    def glib2_schemas( self ):
+        return self.local_share/'glib-2.0'/'schemas'
+
+    @lazyproperty
+    def gsextensions( self ):
+        return self.local_share/'gnome-shell'/'extensions'
+
+    @lazyproperty
+    def icons( self ):
+        return self.local_share/'icons'
+
+    @lazyproperty
+    def fonts( self ):
+        return self.local_share/'fonts'
+
+    @lazyproperty
+    def themes( self ):
+        return self.local_share/'themes'
+
+    @lazyproperty
+    def backgrounds( self ):
+        return self.local_share/'backgrounds'
+
+    @lazyproperty
+    def gbackgrounds_properties( self ):
+        return self.local_share/'gnome-background-properties'
+
+    @lazyproperty
+    def wallpaper_variants_dir( self ):
+        return self.backgrounds/'variants'
+
+    @lazyproperty
+    def cache_dir( self ):
+        return Path( os.environ.get( 'XDG_CACHE_HOME', self.home/'.cache' ) ) / 'revamp1804'
+
+    @lazyproperty
+    def config_dir( self ):
+        return Path( os.environ.get( 'XDG_CONFIG_HOME', self.home/'.config' ) ) / 'revamp1804'
+
+    @lazyproperty
+    def state_dir( self ):
+        return Path( os.environ.get( 'XDG_STATE_HOME', self.home/'.local'/'state' ) ) / 'revamp1804'
+
+
+CONFIG = Config()
+
+
+class HTTPPool:
+    '''Class to keep persistent (keep-alive) HTTP and HTTPS connections per
+    host, so that downloads from the same host reuse their TCP and TLS
+    handshakes instead of paying them for every url.
+
+    Arguments:
+      streams       - requests that may be in flight to one host at the same
+                      time; more wait until one of them is closed. Default is
+                      HTTP_STREAMS_PER_HOST.
+      timeout       - socket timeout in seconds; default is HTTP_TIMEOUT.
+      max_redirects - redirects followed by one request.
+
+    User Methods:
+      request - send a GET request, following redirects, and return a
+                PooledResponse. Like urlopen(), a status other than 2xx
+                raises HTTPError and a connection failure raises URLError.
+                The http(s)_proxy environment variables are honoured.
+      stats   - per host: requests, redirects, connections opened and reused,
+                and the peak number of streams in flight.
+      close   - close the idle connections.
+    '''
+
+    IDLE_TIMEOUT = 15   # seconds after which an idle connection is not reused
+    REDIRECTS = ( 301, 302, 303, 307, 308 )
+
+    def __init__( self, streams=None, timeout=None, max_redirects=5 ):
+        self.streams = streams
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self._lock = Lock()
+        self._idle = {}     # (scheme, host, port) -> [ (connection, idle since) ]
+        self._slots = {}    # (scheme, host, port) -> BoundedSemaphore
+        self._stats = {}    # 'scheme://host:port' -> { counter: amount }
+        self._ssl_context = None
+
+    @staticmethod
+    def _split( url ):
+        parts = urlsplit( url )
+        if parts.scheme not in ( 'http', 'https' ):
+            raise URLError( f'unsupported url scheme {parts.scheme!r}' )
+        port = parts.port or ( 443 if parts.scheme == 'https' else 80 )
+        path = ( parts.path or '/' ) + ( '?' + parts.query if parts.query else '' )
+        return ( parts.scheme, parts.hostname, port ), path
+
+    def _count( self, key, counter, amount=1 ):
+        name = '{}://{}:{}'.format( *key )
+        stats = self._stats.setdefault( name, dict.fromkeys(
+            ( 'requests', 'redirects', 'opened', 'reused', 'streams', 'peak_streams' ), 0 ) )
+        stats[ counter ] += amount
+        stats[ 'peak_streams' ] = max( stats[ 'peak_streams' ], stats[ 'streams' ] )
+
+    def _slot( self, key ):
+        with self._lock:
+            if key not in self._slots:
+                self._slots[ key ] = BoundedSemaphore( self.streams or HTTP_STREAMS_PER_HOST )
+            return self._slots[ key ]
+
+    def _connect( self, key ):
+        '''Return a new, unconnected connection to "key", via a proxy if one
+        is configured for it, and whether requests must use absolute urls.'''
+        import http.client
+        from urllib.request import getproxies, proxy_bypass
+        scheme, host, port = key
+        timeout = self.timeout or HTTP_TIMEOUT
+        proxy = getproxies().get( scheme )
+        if proxy and proxy_bypass( host ):
+            proxy = None
+        headers = {}
+        if proxy:
+            parts = urlsplit( proxy if '://' in proxy else 'http://' + proxy )
+            if parts.username:
+                credentials = f'{unquote( parts.username )}:{unquote( parts.password or "" )}'
+                headers[ 'Proxy-Authorization' ] = 'Basic ' + base64.b64encode(
+                    credentials.encode() ).decode( 'ascii' )
+            host_port = ( parts.hostname, parts.port or 8080 )
+        if scheme == 'https':
+            with self._lock:
+                if self._ssl_context is None:
+                    import ssl
+                    self._ssl_context = ssl.create_default_context()
+            if proxy:
+                connection = http.client.HTTPSConnection( *host_port, timeout=timeout,
+                                                          context=self._ssl_context )
+                connection.set_tunnel( host, port, headers=headers )
+                return connection, False, {}
+            return http.client.HTTPSConnection( host, port, timeout=timeout,
+                                                context=self._ssl_context ), False, {}
+        if proxy:
+            return http.client.HTTPConnection( *host_port, timeout=timeout ), True, headers
+        return http.client.HTTPConnection( host, port, timeout=timeout ), False, {}
+
+    def _checkout( self, key ):
+        '''Return ( (connection, absolute, headers), reused ) for "key". A
+        reused connection is counted by _request() once a request on it
+        succeeded, as the server may have closed it meanwhile.'''
+        with self._lock:
+            idle = self._idle.get( key, [] )
+            while idle:
+                connection, since = idle.pop()
+                if time.monotonic() - since < self.IDLE_TIMEOUT:
+                    return connection, True
+                connection[0].close()
+            self._count( key, 'opened' )
+        return self._connect( key ), False
+
+    def _release( self, key, connection, response, slot ):
+        '''Return "connection" to the idle connections of "key" if "response"
+        was read completely and the server keeps it open, else close it.'''
+        try:
+            if response.isclosed() and not response.will_close:
+                with self._lock:
+                    self._idle.setdefault( key, [] ).append( ( connection, time.monotonic() ) )
+            else:
+                response.close()
+                connection[0].close()
+        finally:
+            with self._lock:
+                self._count( key, 'streams', -1 )
+            slot.release()
+
+    def _request( self, url, headers ):
+        import http.client
+        key, path = self._split( url )
+        slot = self._slot( key )
+        slot.acquire()
+        try:
+            for attempt in range( 2 ):
+                connection, reused = self._checkout( key )
+                conn, absolute, proxy_headers = connection
+                try:
+                    conn.request( 'GET', url if absolute else path,
+                                  headers=dict( proxy_headers, **headers ) )
+                    response = conn.getresponse()
+                except ( http.client.HTTPException, OSError ) as exc:
+                    conn.close()
+                    if reused and attempt == 0:
+                        continue #the server closed the idle connection; retry on a new one
+                    raise URLError( exc ) from exc
+                break
+            with self._lock:
+                self._count( key, 'requests' )
+                self._count( key, 'streams' )
+                if reused:
+                    self._count( key, 'reused' )
+        except BaseException:
+            slot.release()
+            raise
+        return PooledResponse( url, response, lambda: self._release( key, connection, response, slot ) )
+
+    def request( self, url, headers=None ):
+        headers = dict( { 'User-Agent': f'revamp1804/{__version__}' }, **( headers or {} ) )
+        for _ in range( self.max_redirects + 1 ):
+            response = self._request( url, headers )
+            location = response.getheader( 'Location' )
+            if response.status not in self.REDIRECTS or not location:
+                break
+            response.read() #drain it, so its connection can be reused
+            response.close()
+            with self._lock:
+                self._count( self._split( url )[0], 'redirects' )
+            url = urljoin( url, location )
+        else:
+            raise URLError( f'more than {self.max_redirects} redirects: {url}' )
+        if not 200 <= response.status < 300:
+            response.read()
+            response.close()
+            raise HTTPError( url, response.status, response.reason, response.headers, None )
+        return response
+
+    def stats( self ):
+        with self._lock:
+            return { name: dict( stats ) for name, stats in self._stats.items() }
+
+    def close( self ):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                connection[0].close()
+
+
+class PooledResponse:
+    '''Class of the responses of HTTPPool.request(). It behaves like the
+    http.client.HTTPResponse it wraps; closing it, e.g. by leaving its
+    with-block, returns its connection to the pool.'''
+
+    def __init__( self, url, response, release ):
+        self.url = url
+        self._response = response
+        self._release = release
+        self._closed = False
+
+    def __getattr__( self, name ):
+        return getattr( self._response, name )
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *exc ):
+        self.close()
+
+    def geturl( self ):
+        return self.url
+
+    def close( self ):
+        if not self._closed:
+            self._closed = True
+            self._release()
+
+
+HTTP = HTTPPool()
+
+
+class AsyncResponse:
+    '''Class of the responses of request_async(). Like
+    http.client.HTTPResponse it has a status, a reason and headers; its body
+    is read with chunks(). The connection is not reused: closing the
+    response closes it.'''
+
+    def __init__( self, url, status, reason, headers, reader, writer ):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._reader = reader
+        self._writer = writer
+
+    def getheader( self, name, default=None ):
+        return self.headers.get( name, default )
+
+    async def _read( self, size ):
+        import asyncio
+        chunk = await asyncio.wait_for( self._reader.read( size ), HTTP_TIMEOUT )
+        if not chunk:
+            raise ConnectionError( 'connection closed by the server' )
+        return chunk
+
+    async def chunks( self, size ):
+        '''Yield the body, decoded from chunked transfer encoding, in
+        pieces of up to "size" bytes. A body without Content-Length ends when
+        the server closes the connection; a shorter one is left for the
+        caller to detect.'''
+        import asyncio
+        if self.getheader( 'Transfer-Encoding', '' ).strip().lower() == 'chunked':
+            while True:
+                line = await asyncio.wait_for( self._reader.readline(), HTTP_TIMEOUT )
+                if not line:
+                    raise ConnectionError( 'chunked body ended early' )
+                length = int( line.split( b';' )[0].strip(), 16 )
+                if length == 0:
+                    while ( await self._reader.readline() ).strip(): #trailers
+                        pass
+                    return
+                while length:
+                    chunk = await self._read( min( size, length ) )
+                    length -= len( chunk )
+                    yield chunk
+                await self._reader.readline() #CRLF ending the chunk
+        length = self.getheader( 'Content-Length', '' ).strip()
+        remaining = int( length ) if length.isdigit() else None
+        while remaining is None or remaining > 0:
+            chunk = await asyncio.wait_for(
+                self._reader.read( size if remaining is None else min( size, remaining ) ), HTTP_TIMEOUT )
+            if not chunk:
+                return
+            if remaining is not None:
+                remaining -= len( chunk )
+            yield chunk
+
+    def close( self ):
+        self._writer.close()
+
+
+class DownloadError(URLError):
+    '''Base class of the errors of download() and download_async(). It is a
+    URLError, so code that handles the failures of urlopen() handles these.'''
+
+    def __init__( self, url, reason ):
+        super().__init__( reason )
+        self.url = url
+
+    def __str__( self ):
+        return f'{self.url}: {self.reason}'
+
+
+class HTTPStatusError(DownloadError):
+    '''The server answered with a status other than 2xx, e.g. 304 to a
+    conditional request or 404.'''
+
+    def __init__( self, url, code, reason, headers=None ):
+        super().__init__( url, f'HTTP {code} {reason}' )
+        self.code = code
+        self.headers = headers
+
+
+class IncompleteDownloadError(DownloadError):
+    '''The body of a response ended before its Content-Length.'''
+
+    def __init__( self, url, received, expected ):
+        super().__init__( url, f'received {received} of {expected} bytes' )
+        self.received = received
+        self.expected = expected
+
+
+class Spool:
+    '''Class to collect the body of a download while hashing it. Up to
+    "ceiling" bytes are kept in a BytesIO; a larger body is moved to a
+    temporary file in "dst_dir", so it is never held in RAM as a whole.
+
+    Arguments:
+      dst_dir - directory of the temporary file, a pathlib.Path() object.
+      ceiling - default is MEMORY_CEILING.
+
+    Attributes:
+      size   - number of bytes written.
+      sha256 - hashlib object of the bytes written.
+
+    User Methods:
+      write   - append a chunk.
+      reset   - drop what was written, e.g. when a download restarts at byte 0.
+      close   - return the BytesIO, or the pathlib.Path() of the temporary
+                file, which the caller then owns.
+      discard - drop what was written and delete the temporary file.
+    '''
+
+    def __init__( self, dst_dir, ceiling=None ):
+        self.dst_dir = dst_dir
+        self.ceiling = MEMORY_CEILING if ceiling is None else ceiling
+        self._file = None
+        self.reset()
+
+    def write( self, chunk ):
+        self.sha256.update( chunk )
+        self.size += len( chunk )
+        PROFILER.add( 'downloaded', len( chunk ) )
+        if self._file is None and self.size > self.ceiling:
+            self._file = NamedTemporaryFile( dir=str(self.dst_dir), suffix='.part', delete=False )
+            self._file.write( self._buffer.getbuffer() )
+            self._buffer = None
+        if self._file is None:
+            self._buffer.write( chunk )
+        else:
+            self._file.write( chunk )
+
+    def reset( self ):
+        self.discard()
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def close( self ):
+        if self._file is None:
+            return self._buffer
+        self._file.close()
+        path, self._file = Path( self._file.name ), None
+        return path
+
+    def discard( self ):
+        if self._file is not None:
+            self._file.close()
+            os.unlink( self._file.name )
+            self._file = None
+        self._buffer = BytesIO()
+
+
+class DownloadProgress:
+    '''Class to show one progress line for the concurrent downloads of
+    run_archives_asyncio(): archives done of all, bytes received so far of
+    those expected, the throughput over the last WINDOW seconds, the archives
+    in flight and an ETA. The ETA is shown once the size of every archive is
+    known. When "live" and on a terminal the line is rewritten in place;
+    otherwise a line is printed every LOG_INTERVAL seconds.
+
+    Arguments:
+      total - number of archives.
+      live  - False when other output is printed at the same time, e.g. by a
+              phase running in the foreground.
+
+    User Methods:
+      expect  - a download of an url starts; its total size may be unknown,
+                and "received" bytes of it were kept from an earlier attempt.
+      advance - count bytes received for an url.
+      done    - an url is complete, whether it was downloaded or not.
+      show    - print the progress line; "final" ends it with a newline.
+    '''
+
+    WINDOW = 5.0
+    LOG_INTERVAL = 5.0
+
+    def __init__( self, total, live=True ):
+        self.total = total
+        self._expected = {}     # url -> bytes, or None if unknown
+        self._received = {}     # url -> bytes
+        self._done = set()
+        self._start = time.monotonic()
+        self._samples = []      # [ (time, bytes received) ] of the last WINDOW seconds
+        self._printed = 0
+        self._tty = live and sys.stdout.isatty()
+
+    def expect( self, url, size, received=0 ):
+        self._expected[ url ] = size
+        self._received[ url ] = received
+
+    def advance( self, url, amount ):
+        self._received[ url ] = self._received.get( url, 0 ) + amount
+
+    def done( self, url ):
+        self._done.add( url )
+
+    def _rate( self, now, received ):
+        self._samples.append( ( now, received ) )
+        while len( self._samples ) > 2 and now - self._samples[1][0] >= self.WINDOW:
+            self._samples.pop( 0 )
+        then, before = self._samples[0]
+        return ( received - before ) / ( now - then ) if now > then else 0.0
+
+    def line( self ):
+        now = time.monotonic()
+        received = sum( self._received.values() )
+        rate = self._rate( now, received )
+        sizes = [ self._expected[url] for url in self._expected if url not in self._done ]
+        pending = self.total - len( self._done ) - len( sizes )
+        if pending or None in sizes:
+            expected, eta = '?', '?'
+        else:
+            remaining = sum( sizes ) - sum( self._received[url] for url in self._expected
+                                            if url not in self._done )
+            expected = f'{( received + remaining ) / 1024**2:.1f}'
+            eta = f'{remaining / rate:.0f} sec' if rate else ( '0 sec' if not remaining else '?' )
+        return ( f' {len(self._done)}/{self.total} archives, {received / 1024**2:.1f} of {expected} MB, '
+                 f'{rate / 1024**2:.2f} MB/s, {len(sizes)} in flight, ETA {eta}, '
+                 f'{now - self._start:.0f} sec' )
+
+    def show( self, final=False ):
+        line = self.line()
+        if self._tty:
+            print( f'\r{line:<100}', end='\n' if final else '', flush=True )
+        elif final or time.monotonic() - self._printed >= self.LOG_INTERVAL:
+            self._printed = time.monotonic()
+            print( line, flush=True )
+
+
+class CacheMissError(Exception):
+    pass
+
+
+class DownloadCache:
+    '''Class to keep a persistent, content-addressed, on-disk cache of the
+    downloaded archives.
+
+    Arguments:
+      root      - directory of the cache, a pathlib.Path() object. Default is
+                  CONFIG.cache_dir/'downloads', resolved when first used.
+      max_bytes - size limit of the cached archives. Least recently used
+                  archives are evicted beyond it.
+      offline   - if True, never access the network; only cached archives
+                  are served.
+
+    Layout:
+      root/index.json        - per url: sha256, size, etag, last_modified, last_used.
+      root/objects/<sha256>  - archive content, shared by urls with the same content.
+
+    User Methods:
+      fetch    - return the path of the cached content of an url, revalidating
+                 it with its ETag/Last-Modified first unless offline or already
+                 done by this process.
+      begin    - the first step of fetch(): the cached path, or the headers of
+                 the conditional request to make.
+      fallback - the cached path after a failed download, if it may be used.
+      failed   - record a failed download for the next fetch() to raise.
+      store    - add a completed download; the last step of fetch().
+      discard  - forget the cached content of an url, e.g. when it is corrupt.
+      evict    - drop least recently used archives until max_bytes is respected.
+    '''
+
+    def __init__( self, root=None, max_bytes=1024**3, offline=False ):
+        if root is not None:
+            self.root = root
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._lock = Lock()
+        self._index = None
+        self._fresh = set()     # urls fetched or revalidated by this process
+        self._failed = {}       # url -> error of a download made ahead by failed()
+
+    @lazyproperty
+    def root( self ):
+        return CONFIG.cache_dir / 'downloads'
+
+    @property
+    def objects( self ):
+        return self.root / 'objects'
+
+    def _load( self ):
+        if self._index is None:
+            try:
+                with open( self.root / 'index.json', 'r' ) as file:
+                    self._index = json.load( file )
+            except ( FileNotFoundError, ValueError ):
+                self._index = {}
+        return self._index
+
+    def _save( self ):
+        self.root.mkdir( parents=True, exist_ok=True )
+        atomic_write( self.root / 'index.json', json.dumps( self._index, indent=1 ) )
+
+    def _cached( self, url ):
+        '''Return the index entry of url if its content is still on disk.'''
+        entry = self._load().get( url )
+        if entry and ( self.objects / entry['sha256'] ).is_file():
+            return entry
+        return None
+
+    def _touch( self, url ):
+        self._index[url]['last_used'] = time.time()
+        self._save()
+        self._fresh.add( url )
+        return self.objects / self._index[url]['sha256']
+
+    def cached_sha256( self, url ):
+        '''Return the sha256 of the cached content of url, or None. Never
+        accesses the network.'''
+        with self._lock:
+            entry = self._cached( url )
+            return entry['sha256'] if entry else None
+
+    def discard( self, url ):
+        with self._lock:
+            entry = self._load().pop( url, None )
+            self._fresh.discard( url )
+            if entry and not any( e['sha256'] == entry['sha256'] for e in self._index.values() ):
+                try:
+                    ( self.objects / entry['sha256'] ).unlink()
+                except FileNotFoundError:
+                    pass
+            self._save()
+
+    def begin( self, url ):
+        '''Return ( path, None ) when the content of "url" is served from the
+        cache without accessing the network, else ( None, headers ) with the
+        headers of the conditional request that revalidates it.'''
+        with self._lock:
+            error = self._failed.pop( url, None )
+            if error is not None:
+                raise error
+            entry = self._cached( url )
+            if entry and url in self._fresh:
+                return self._touch( url ), None
+            if self.offline:
+                if entry is None:
+                    raise CacheMissError( f'{url} is not in the download cache.' )
+                return self._touch( url ), None
+            headers = {}
+            if entry:
+                if entry.get( 'etag' ):
+                    headers['If-None-Match'] = entry['etag']
+                if entry.get( 'last_modified' ):
+                    headers['If-Modified-Since'] = entry['last_modified']
+            return None, headers
+
+    def fallback( self, url, error ):
+        '''Return the path of the cached content of "url" after its download
+        failed with "error" when that content may still be used, i.e. the
+        server answered 304, or it failed with 5xx or could not be reached.
+        Otherwise raise "error".'''
+        code = getattr( error, 'code', None )
+        with self._lock:
+            entry = self._cached( url )
+            if entry and code == 304:
+                return self._touch( url )
+            if entry and ( code is None or code >= 500 ):
+                print( f' Unable to revalidate {url}; using the cached copy.' )
+                return self._touch( url )
+        raise error
+
+    def failed( self, url, error ):
+        '''Record that downloading "url" ahead of its use failed with
+        "error". The next begin() or fetch() of "url" raises "error" instead
+        of downloading it again, so the code that uses "url" handles the
+        failure as if it had downloaded it itself.'''
+        with self._lock:
+            self._failed[ url ] = error
+
+    def store( self, url, spool, headers ):
+        '''Store the complete download of "url", a Spool, with the headers
+        of its response. Returns the path of the content.'''
+        size, sha256 = spool.size, spool.sha256.hexdigest()
+        spool = spool.close()
+        etag = headers.get( 'ETag' )
+        last_modified = headers.get( 'Last-Modified' )
+        with self._lock:
+            blob = self.objects / sha256
+            if isinstance( spool, Path ):
+                atomic_replace( spool, blob )
+            elif not blob.is_file():
+                atomic_write( blob, spool.getvalue() )
+            self._load()[url] = { 'sha256': sha256, 'size': size,
+                                  'etag': etag, 'last_modified': last_modified,
+                                  'last_used': time.time() }
+            self._fresh.add( url )
+            self._evict( keep=url )
+            self._save()
+        return blob
+
+    def fetch( self, url ):
+        '''Return a pathlib.Path() to the content of "url".'''
+        path, headers = self.begin( url )
+        if path is not None:
+            return path
+        self.objects.mkdir( parents=True, exist_ok=True )
+        try:
+            spool, response_headers = download( url, self.objects, headers )
+        except DownloadError as e:
+            return self.fallback( url, e )
+        return self.store( url, spool, response_headers )
+
+    def evict( self ):
+        with self._lock:
+            self._evict()
+            self._save()
+
+    def _evict( self, keep=None ):
+        '''Drop least recently used contents until max_bytes is respected.
+        A content is counted and dropped once, with every url that shares
+        it, so no url is forgotten without freeing its bytes; the content of
+        "keep" is never dropped.'''
+        index = self._load()
+        blobs = {}      # sha256 -> [ size, last used, urls ]
+        for url, entry in index.items():
+            blob = blobs.setdefault( entry['sha256'], [ entry['size'], 0, [] ] )
+            blob[1] = max( blob[1], entry['last_used'] )
+            blob[2].append( url )
+        total = sum( blob[0] for blob in blobs.values() )
+        for sha256, ( size, _, urls ) in sorted( blobs.items(), key=lambda b: b[1][1] ):
+            if total <= self.max_bytes:
+                break
+            if keep in urls:
+                continue
+            for url in urls:
+                del index[url]
+            total -= size
+            try:
+                ( self.objects / sha256 ).unlink()
+            except FileNotFoundError:
+                pass
+
+
+CACHE = DownloadCache()
+
+
+class AptSourcesIndex:
+    '''Class to index the PPAs of the active "deb" entries of the apt sources
+    files. The files are parsed once; they are parsed again only when one of
+    them changes, so the index is cheap to query repeatedly.
+
+    User Methods:
+      has     - whether a ppa, e.g. 'ppa:owner/name', has a deb entry.
+      missing - the ppas of a list that have no deb entry.
+    '''
+
+    PPA_URL = re.compile( r'^deb\s+(?:\[[^\]]*\]\s+)?https?://ppa\.launchpad(?:content)?\.net/([^/\s]+)/([^/\s]+)/' )
+
+    def __init__( self ):
+        self._lock = Lock()
+        self._signature = None
+        self._ppas = {}  # (owner, name) -> set of sources files
+
+    @staticmethod
+    def key( ppa ):
+        '''Normalize 'ppa:owner/name' to ('owner', 'name').'''
+        owner, _, name = ppa[ len('ppa:'): ].strip().partition( '/' )
+        return owner.lower(), ( name or 'ppa' ).lower()
+
+    def _refresh( self ):
+        sourcesd = Path( '/etc/apt/sources.list.d' )
+        mtimes = apt_sources_mtimes()
+        signature = ( mtimes, sourcesd.stat().st_mtime if sourcesd.exists() else None )
+        if signature == self._signature:
+            return
+        ppas = {}
+        for source in mtimes:
+            with open( source, 'r' ) as f:
+                for line in f:
+                    match = self.PPA_URL.match( line.strip() )
+                    if match:
+                        key = ( match.group(1).lower(), match.group(2).lower() )
+                        ppas.setdefault( key, set() ).add( source )
+        self._ppas = ppas
+        self._signature = signature
+
+    def has( self, ppa ):
+        with self._lock:
+            self._refresh()
+            return self.key( ppa ) in self._ppas
+
+    def missing( self, ppas ):
+        with self._lock:
+            self._refresh()
+            return [ ppa for ppa in ppas if self.key( ppa ) not in self._ppas ]
+
+
+APT_SOURCES = AptSourcesIndex()
+
+
+class Journal:
+    '''Class to persist the progress of install() or remove(), so that a run
+    that failed halfway can be resumed with --resume.
+
+    Arguments:
+      path - journal file, a pathlib.Path() object. Default is
+             CONFIG.state_dir/'journal.json', resolved when first used.
+
+    Attributes:
+      resume - if True, begin() keeps what an earlier run of the same
+               operation recorded; otherwise it starts a new journal.
+
+    User Methods:
+      begin         - start recording an operation, e.g. 'install'.
+      phase_done    - whether a phase was recorded as completed.
+      mark_phase    - record a phase as completed.
+      artifact      - the record of an installed archive url, or None.
+      mark_artifact - record an installed archive url with its content hash.
+      clear         - delete the journal once the operation has completed.
+    '''
+
+    def __init__( self, path=None, resume=False ):
+        if path is not None:
+            self.path = path
+        self.resume = resume
+        self._lock = Lock()
+        self._data = { 'operation': None, 'phases': [], 'artifacts': {} }
+
+    @lazyproperty
+    def path( self ):
+        return CONFIG.state_dir / 'journal.json'
+
+    def begin( self, operation ):
+        with self._lock:
+            data = None
+            if self.resume:
+                try:
+                    with open( self.path, 'r' ) as file:
+                        data = json.load( file )
+                except ( FileNotFoundError, ValueError ):
+                    pass
+            if data and data.get( 'operation' ) == operation:
+                print( f'\nResuming {operation}: {len(data["phases"])} phase(s) and '
+                       f'{len(data["artifacts"])} artifact(s) were completed earlier.' )
+            else:
+                data = { 'operation': operation, 'phases': [], 'artifacts': {} }
+            self._data = data
+            self._save()
+
+    def _save( self ):
+        self.path.parent.mkdir( parents=True, exist_ok=True )
+        atomic_write( self.path, json.dumps( self._data, indent=1 ) )
+
+    def phase_done( self, name ):
+        with self._lock:
+            return name in self._data['phases']
+
+    def mark_phase( self, name ):
+        with self._lock:
+            self._data['phases'].append( name )
+            self._save()
+
+    def artifact( self, url ):
+        with self._lock:
+            return self._data['artifacts'].get( url )
+
+    def mark_artifact( self, url, sha256, paths, output ):
+        with self._lock:
+            self._data['artifacts'][url] = { 'sha256': sha256, 'output': output,
+                                             'paths': [ str(p) for p in paths ] }
+            self._save()
+
+    def clear( self ):
+        with self._lock:
+            self._data = { 'operation': None, 'phases': [], 'artifacts': {} }
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+JOURNAL = Journal()
+
+
+class Phase:
+    '''Class to describe one phase of the install() or remove() pipelines for
+    run_phases().
+
+    Arguments:
+      func     - function that performs the phase; its name names the phase.
+      requires - names of the phases that must complete before this one.
+      locks    - names of the resources the phase holds exclusively while it
+                 runs, e.g. 'apt', 'dconf' or 'network'.
+      name     - name of the phase if it should differ from the function name.
+      journal  - if False, the phase is not recorded in the Journal and is
+                 always run, e.g. because it journals its own work.
+    '''
+
+    def __init__( self, func, requires=(), locks=(), name=None, journal=True ):
+        self.func = func
+        self.name = name or func.__name__
+        self.requires = set( requires )
+        self.locks = set( locks )
+        self.journal = journal
+
+
+class Profiler:
+    '''Class to measure, per phase, the wall time, the CPU time, the child
+    processes launched through run(), the bytes downloaded and the bytes
+    written to storage. CPU time and bytes written are measured per thread,
+    so phases running at the same time are told apart.
+
+    Attributes:
+      enabled - measure only when True, i.e. with --profile; otherwise every
+                method does nothing.
+
+    User Methods:
+      phase  - context manager measuring the work done in this thread as a phase.
+      bind   - wrap a function so that the work it does in another thread is
+               measured as part of the phase current in this thread.
+      child  - record a child process that ran for some seconds.
+      span   - record the wall time of work that ran outside phase(), e.g.
+               in the background, with its start and end.
+      add    - add an amount to a counter, e.g. 'downloaded', of the current phase.
+      report - the measurements as a dict that can be serialized to JSON.
+      show   - print the measurements as a table, longest phase first.
+      dump   - write the report as JSON to a file, or to stdout for '-'.
+    '''
+
+    OTHER = '(outside phases)'
+    COUNTERS = ( 'wall', 'cpu', 'children', 'child_wall', 'downloaded', 'written' )
+
+    def __init__( self, enabled=False ):
+        self.enabled = enabled
+        self._lock = Lock()
+        self._local = local()
+        self._stats = {}    # phase name -> { counter: amount }
+        self._t0 = time.monotonic()
+
+    @staticmethod
+    def _thread_usage():
+        '''Return (cpu seconds, bytes written to storage) of this thread; the
+        latter is None if the kernel does not account per-task I/O.'''
+        usage = resource.getrusage( resource.RUSAGE_THREAD )
+        written = None
+        try:
+            with open( '/proc/thread-self/io', 'r' ) as file:
+                for line in file:
+                    if line.startswith( 'write_bytes:' ):
+                        written = int( line.split()[1] )
+        except OSError:
+            pass
+        return usage.ru_utime + usage.ru_stime, written
+
+    @property
+    def current( self ):
+        return getattr( self._local, 'phase', None )
+
+    def add( self, counter, amount, name=None ):
+        if not self.enabled:
+            return
+        name = name or self.current or self.OTHER
+        with self._lock:
+            stats = self._stats.setdefault( name, dict.fromkeys( self.COUNTERS, 0 ) )
+            stats[ counter ] += amount
+
+    def child( self, seconds ):
+        self.add( 'children', 1 )
+        self.add( 'child_wall', seconds )
+
+    def span( self, name, start, end ):
+        '''Record that "name" ran from time.monotonic() "start" to "end".'''
+        if not self.enabled:
+            return
+        self.add( 'wall', end - start, name )
+        with self._lock:
+            self._stats[ name ].update( start=start - self._t0, end=end - self._t0 )
+
+    @contextmanager
+    def _measure( self, name, wall ):
+        previous = self.current
+        self._local.phase = name
+        start = time.monotonic()
+        cpu, written = self._thread_usage()
+        try:
+            yield
+        finally:
+            cpu1, written1 = self._thread_usage()
+            if wall:
+                self.add( 'wall', time.monotonic() - start, name )
+            self.add( 'cpu', cpu1 - cpu, name )
+            if written is not None and written1 is not None:
+                self.add( 'written', written1 - written, name )
+            self._local.phase = previous
+
+    @contextmanager
+    def phase( self, name ):
+        if not self.enabled:
+            yield
+            return
+        with self._measure( name, wall=True ):
+            yield
+
+    def bind( self, func, name=None ):
+        name = name or self.current
+        if not self.enabled or name is None:
+            return func
+
+        def bound( *args, **kwargs ):
+            if self.current == name: #already measured in this thread
+                return func( *args, **kwargs )
+            with self._measure( name, wall=False ):
+                return func( *args, **kwargs )
+        return bound
+
+    def report( self ):
+        self_usage = resource.getrusage( resource.RUSAGE_SELF )
+        children_usage = resource.getrusage( resource.RUSAGE_CHILDREN )
+        with self._lock:
+            phases = { name: dict( stats ) for name, stats in self._stats.items() }
+        total = { counter: sum( stats[counter] for stats in phases.values() )
+                  for counter in self.COUNTERS }
+        total.update( wall=time.monotonic() - self._t0,
+                      cpu=self_usage.ru_utime + self_usage.ru_stime,
+                      children_cpu=children_usage.ru_utime + children_usage.ru_stime )
+        return { 'phases': phases, 'total': total, 'http': HTTP.stats() }
+
+    def show( self, report=None ):
+        report = report or self.report()
+        total = report['total']
+        print( f'\nProfile (wall-clock {total["wall"]:.2f} sec, cpu {total["cpu"]:.2f} sec, '
+               f'child processes cpu {total["children_cpu"]:.2f} sec):' )
+        print( f' {"wall":>8} {"cpu":>8} {"children":>8} {"child-sec":>9} '
+               f'{"downloaded":>11} {"written":>11}  phase' )
+        phases = sorted( report['phases'].items(), key=lambda item: item[1]['wall'], reverse=True )
+        for name, stats in phases:
+            if 'start' in stats:
+                name = f'{name} [{stats["start"]:.2f}-{stats["end"]:.2f} sec]'
+            print( f' {stats["wall"]:8.2f} {stats["cpu"]:8.2f} {stats["children"]:8d} '
+                   f'{stats["child_wall"]:9.2f} {stats["downloaded"]:11,d} {stats["written"]:11,d}  {name}' )
+        if report.get( 'http' ):
+            print( f'\n {"requests":>8} {"redirects":>9} {"opened":>8} {"reused":>8} {"peak":>8}  host' )
+            for host, stats in sorted( report['http'].items() ):
+                print( f' {stats["requests"]:8d} {stats["redirects"]:9d} {stats["opened"]:8d} '
+                       f'{stats["reused"]:8d} {stats["peak_streams"]:8d}  {host}' )
+
+    def dump( self, path, report=None ):
+        report = report or self.report()
+        text = json.dumps( report, indent=1, sort_keys=True )
+        if str( path ) == '-':
+            print( text )
+        else:
+            atomic_write( path, text + '\n' )
+            print( f'Profile written to {path}' )
+
+
+PROFILER = Profiler()
 
 
 #=================
@@ -143,6 +1240,27 @@ def _fonts_url2():
     return [ macfonts ]
 
 
+def _arc_menu_icon_url():
+    return 'https://assets.ubuntu.com/v1/9fbc8a44-circle-of-friends-web.zip'
+
+
+def _archive_filter( url ):
+    '''Return the function that selects the members of the archive at "url"
+    that are needed at runtime, or None to extract all of them.'''
+    if url in _icons_url():
+        return member_filter( exclude=ICONS_EXCLUDE, depth=2, anywhere=ICONS_EXCLUDE_ANYWHERE )
+    if url in _cursors_url():
+        return member_filter( include=CURSORS_INCLUDE )
+    if url in _fonts_url1() + _fonts_url2():
+        return member_filter( include=FONTS_INCLUDE )
+    return None
+
+
+def _prefetch_urls():
+    return ( _extensions_url() + _icons_url() + _cursors_url() + _fonts_url1()
+             + _fonts_url2() + [ _arc_menu_icon_url() ] )
+
+
 def show_header():
     print()
     print( f'             @@@@@@  @@@@@@@ @       @    @       @       @ @@@@@@')
@@ -159,9 +1277,8 @@ def show_header():
 def show_intro():
     show_header()
     check_system_platform_and_Ubuntu_distribution()
-    print( f'\nUser : {USERNAME}' )
+    print( f'\nUser : {CONFIG.username}' )
     print( f'Linux Distro : { " ".join(DISTRO.values()) }\n' )
-    time.sleep(1)
 
 
 def check_system_platform_and_Ubuntu_distribution():
@@ -180,30 +1297,30 @@ def check_system_platform_and_Ubuntu_distribution():
 
 def update_apt_repository():
     '''Function to add the required ppas to apt-repository if they do not exist.'''
-    #1. Install package to avoid "add-apt-repository: command not found error"
-    apt_install( ['software-properties-common'] )
-    #2. Add 'ppa:dyatlov-igor/sierra-theme' to apt_repository if it does not
-    #   exist.
-    repos = [ Path( '/etc/apt/sources.list' ) ]
-    repos.extend( [ x for x in Path( '/etc/apt/sources.list.d/' ).iterdir() ] )
-    ppas_to_add = PPA
-    for repo in repos:
-        with open( repo, 'r') as f:
-            for line in f:
-                if 'deb http' in line:
-                    for ppa in PPA:
-                        if ppa[4:] in line:
-                            ppas_to_add.remove( ppa )
-    #print( 'repos =', repos )
+    #1. Find the ppas, e.g. 'ppa:dyatlov-igor/sierra-theme', that are not in
+    #   apt_repository yet.
+    ppas_to_add = APT_SOURCES.missing( PPA )
     #print( 'ppas_to_add =', ppas_to_add )
     if ppas_to_add:
-        for ppa in ppas_to_add:
-            add_apt_repository( ppa )
+        #2. Install package to avoid "add-apt-repository: command not found error"
+        if which( 'add-apt-repository' ) is None:
+            apt_install( ['software-properties-common'] )
+        add_apt_repositories( ppas_to_add )
         print( f'\nPPA is updated into apt-repository.' )
     else:
         print( f'\napt-repository is already up to date.' )
     
 
+def run( *popenargs, **kwargs ):
+    '''subprocess.run() that counts the child process and how long it ran
+    towards the current phase of PROFILER.'''
+    start = time.monotonic()
+    try:
+        return subprocess.run( *popenargs, **kwargs )
+    finally:
+        PROFILER.child( time.monotonic() - start )
+
+
 def runN( cmd ):
     #print( f"\nRunning command: {' '.join(cmd)}" )
     print( f"\n{' '.join(cmd)}" )
@@ -213,18 +1330,69 @@ def runN( cmd ):
 
 def add_apt_repository( ppa ):
     '''Function to add apt sources.list entries. Argument ppa is a string.'''
-    cmd = [ 'sudo', 'add-apt-repository', '-y' ]
-    cmd.append( ppa )
+    add_apt_repositories( [ ppa ] )
+
+
+def add_apt_repositories( ppas ):
+    '''Function to add the apt sources.list entries of several ppas. Argument
+    ppas is a list of string(s). The package lists of the sources file(s) they
+    changed are then updated in one go.'''
+    before = apt_sources_mtimes()
+    for ppa in ppas:
+        cmd = [ 'sudo', 'add-apt-repository', '-y', '--no-update' ]
+        cmd.append( ppa )
+        runN( cmd )
+    after = apt_sources_mtimes()
+    changed = [ src for src in sorted( after ) if before.get( src ) != after[src] ]
+    if changed:
+        apt_update_sources( changed )
+
+
+def apt_sources_mtimes():
+    '''Function to return the modification time of each apt sources file.'''
+    sources = [ Path( '/etc/apt/sources.list' ) ]
+    sources.extend( Path( '/etc/apt/sources.list.d/' ).glob( '*.list' ) )
+    return { src: src.stat().st_mtime for src in sources if src.exists() }
+
+
+def apt_lists_are_fresh( ttl=None ):
+    '''Function to determine whether the apt package lists were refreshed
+    less than "ttl" seconds ago and after the apt sources last changed.'''
+    ttl = APT_TTL if ttl is None else ttl
+    refreshed = [ Path( '/var/lib/apt/periodic/update-success-stamp' ),
+                  Path( '/var/lib/apt/lists' ), Path( '/var/lib/apt/lists/partial' ) ]
+    refreshed = max( [ x.stat().st_mtime for x in refreshed if x.exists() ], default=0 )
+    sourcesd = Path( '/etc/apt/sources.list.d' )
+    changed = list( apt_sources_mtimes().values() )
+    if sourcesd.exists():
+        changed.append( sourcesd.stat().st_mtime )  #also catches removed files
+    return refreshed > max( changed, default=0 ) and time.time() - refreshed < ttl
+
+
+def apt_update( force=False ):
+    if not force and apt_lists_are_fresh():
+        print( f'\napt package lists are up to date; skipped apt-get update.' )
+        return
+    cmd = [ 'sudo', 'apt-get', '-y', 'update' ]
     runN( cmd )
 
 
-def apt_update():
-    cmd = [ 'sudo', 'apt-get', '-y', 'update' ]
-    runN( cmd )
+def apt_update_sources( sources ):
+    '''Function to update the package lists of the given apt sources files only.'''
+    with TemporaryDirectory() as parts:
+        for source in sources:
+            os.symlink( source, Path( parts ) / source.name )
+        cmd = [ 'sudo', 'apt-get', '-y', 'update',
+                '-o', 'Dir::Etc::sourcelist=/dev/null',
+                '-o', f'Dir::Etc::sourceparts={parts}',
+                '-o', 'APT::Get::List-Cleanup=0' ]
+        runN( cmd )
 
 
-def apt_dist_upgrade():
-    cmd = [ 'sudo', 'apt-get', '-y', 'dist-upgrade' ]
+def apt_dist_upgrade( pkgs=() ):
+    '''Function to dist-upgrade the system and install the Debian Package(s)
+    of "pkgs", a list of string(s), in the same apt transaction.'''
+    cmd = [ 'sudo', 'apt-get', '-y', 'dist-upgrade' ] + list( pkgs )
     runN( cmd )
 
 
@@ -234,8 +1402,25 @@ def apt_install( pkgs ):
     runN( cmd )
 
 
+def missing_apt_pkgs( pkgs ):
+    '''Function to return the Debian Package(s) of "pkgs" that are not
+    installed, using one dpkg-query call. Argument pkgs is a list of string(s).'''
+    result = run( [ 'dpkg-query', '-W', '-f=${Package} ${db:Status-Status}\n' ] + pkgs,
+                  stdout=PIPE, stderr=DEVNULL, encoding='utf8' )
+    installed = { line.split()[0] for line in result.stdout.splitlines()
+                  if line.endswith( ' installed' ) }
+    return [ pkg for pkg in pkgs if pkg not in installed ]
+
+
 def install_apt_pkgs():
-    apt_install( GNOME_DEB_PKGS )
+    '''Function to install the missing GNOME_DEB_PKGS and dist-upgrade the
+    system in one apt transaction. apt is not run at all when every package
+    is already installed.'''
+    missing = missing_apt_pkgs( GNOME_DEB_PKGS )
+    if not missing:
+        print( f'\nAll {len(GNOME_DEB_PKGS)} deb packages are already installed.' )
+        return
+    apt_dist_upgrade( missing )
 
 
 def apt_remove( pkgs ):
@@ -250,52 +1435,55 @@ def remove_apt_pkgs():
 
 def install_themes_fonts_gsextensions():
     global INSTALLED_GSEXTENSIONS
-    macfonts = FONTS / 'macfonts'
+    import concurrent.futures as cf
+    makedirs( CONFIG.gsextensions, CONFIG.icons, CONFIG.fonts, CONFIG.themes,
+              CONFIG.glib2_schemas )
+    macfonts = CONFIG.fonts / 'macfonts'
     print( f'\nInstalling GNOME Theme Icons, Fonts and Extensions ...' )
     #1. Download extensions, fonts and icons
     start = time.time()
-    with cf.ThreadPoolExecutor() as executor:
-        extensions = executor.map( install_theme_font_or_gsextension, _extensions_url(), repeat( GSEXTENSIONS ) )
-        icons  = executor.map( install_theme_font_or_gsextension, _icons_url(),   repeat( ICONS ) )
-        cursor = executor.map( install_theme_font_or_gsextension, _cursors_url(), repeat( ICONS ) )
-        font1  = executor.map( install_theme_font_or_gsextension, _fonts_url1(),  [ FONTS ] )
-        font2  = executor.map( install_theme_font_or_gsextension, _fonts_url2(),  [ macfonts ]  )
+    groups = [ ( _extensions_url(), CONFIG.gsextensions ), ( _icons_url(), CONFIG.icons ),
+               ( _cursors_url(), CONFIG.icons ), ( _fonts_url1(), CONFIG.fonts ),
+               ( _fonts_url2(), macfonts ) ]
+    if _use_asyncio( [ url for urls, _ in groups for url in urls ] ):
+        results = iter( run_archives_asyncio( [ ( url, dst ) for urls, dst in groups for url in urls ],
+                                              install_theme_font_or_gsextension ) )
+        extensions, icons, cursor, font1, font2 = [ [ next( results ) for _ in urls ]
+                                                    for urls, _ in groups ]
+    else:
+        install_one = PROFILER.bind( install_theme_font_or_gsextension )
+        with cf.ThreadPoolExecutor() as executor:
+            extensions = executor.map( install_one, _extensions_url(), repeat( CONFIG.gsextensions ) )
+            icons  = executor.map( install_one, _icons_url(),   repeat( CONFIG.icons ) )
+            cursor = executor.map( install_one, _cursors_url(), repeat( CONFIG.icons ) )
+            font1  = executor.map( install_one, _fonts_url1(),  [ CONFIG.fonts ] )
+            font2  = executor.map( install_one, _fonts_url2(),  [ macfonts ]  )
     end = time.time()
 
-    #2. Manually enable GNOME Shell extensions that were installed via "sudo apt-get install gnome-shell-extensions".
-    sudo_gsextensions = [ 'user-theme@gnome-shell-extensions.gcampax.github.com',
-                          'workspace-indicator@gnome-shell-extensions.gcampax.github.com',
-                          'drive-menu@gnome-shell-extensions.gcampax.github.com',
-                          'dash-to-dock@micxgx.gmail.com' ]
-    for ext in sudo_gsextensions:
-        if Path( f'/usr/share/gnome-shell/extensions/{ext}' ).exists():
-            run( f'gnome-shell-extension-tool -e {ext}', shell=True)
-
-    #3. Print out results:
+    #2. Print out results:
     print( f'\nInstalling GNOME Theme Icons, Fonts and Extensions ... Completed in {end-start:.2f} sec' )
-    print( f' - {ICONS} = {list(icons) + list(cursor)}' )
-    print( f' - {FONTS} = {list(font1) + list(font2)}' )
-    INSTALLED_GSEXTENSIONS = list( extensions )
+    print( f' - {CONFIG.icons} = {[ x for x in list(icons) + list(cursor) if x ]}' )
+    print( f' - {CONFIG.fonts} = {[ x for x in list(font1) + list(font2) if x ]}' )
+    INSTALLED_GSEXTENSIONS = [ x for x in extensions if x ] #None when missing from the cache
     count = 0
     for i in INSTALLED_GSEXTENSIONS:
         if count == 0:
-            print(f" - {GSEXTENSIONS} = ['{i}',")
+            print(f" - {CONFIG.gsextensions} = ['{i}',")
         else:
             print(f"{'':55}'{i}',")
         count += 1
     print(f"{'':55}]")
-    #print( f' - {GSEXTENSIONS} = {INSTALLED_GSEXTENSIONS}' )
+    #print( f' - {CONFIG.gsextensions} = {INSTALLED_GSEXTENSIONS}' )
 
-    #4. Compile schemas in GLIB2_SCHEMAS
-    run( ['glib-compile-schemas', GLIB2_SCHEMAS], stdout=sys.stdout )
+    #3. Compile schemas in CONFIG.glib2_schemas, if they changed
+    compile_glib2_schemas()
 
-    #5. Check compiled schemas in GLIB2_SCHEMAS
-    glib_ext_schema = run(
-        [f'ls ~/.local/share/glib-2.0/schemas/ | grep org.gnome.shell.extensions' ],
-        stdout=PIPE, shell=True ).stdout.decode().splitlines()
+    #4. Check compiled schemas in CONFIG.glib2_schemas
+    glib_ext_schema = [ x for x in os.listdir( CONFIG.glib2_schemas )
+                        if 'org.gnome.shell.extensions' in x ]
     #print( f'glib_ext_schema={glib_ext_schema}, type is {type(glib_ext_schema)}')
     detected = []
-    print( f'\nInstallations made to {GLIB2_SCHEMAS}:')
+    print( f'\nInstallations made to {CONFIG.glib2_schemas}:')
     for ext in INSTALLED_GSEXTENSIONS:
         ename = ext[ :ext.index('@') ]
         detected = [x for x in glib_ext_schema if ename in x ]
@@ -306,8 +1494,177 @@ def install_themes_fonts_gsextensions():
             print( f' Checked: {ename:<30} ---> No Schema.' )
 
 
+def prefetch_downloads( live=True ):
+    '''Download every archive into the download cache and verify it, so that
+    installing them later only needs to extract them. A corrupt archive is
+    discarded and downloaded once more. "live" is False when it runs in the
+    background, so its progress does not tear through other output.'''
+    import concurrent.futures as cf
+    print( f'\nPrefetching {len(_prefetch_urls())} archives ...' )
+    start = time.time()
+    if _use_asyncio( _prefetch_urls() ):
+        results = run_archives_asyncio( [ ( url, ) for url in _prefetch_urls() ], prefetch_download,
+                                        live=live )
+    else:
+        with cf.ThreadPoolExecutor() as executor:
+            results = list( executor.map( PROFILER.bind( prefetch_download ), _prefetch_urls() ) )
+    print( f'Prefetching archives ... {results.count(True)} of {len(results)} '
+           f'verified in {time.time()-start:.2f} sec' )
+
+
+def prefetch_download( url ):
+    '''Fetch "url" into the download cache and test its integrity. Returns
+    True if the archive is usable.'''
+    from zipfile import BadZipFile, ZipFile
+    for attempt in range( 2 ):
+        try:
+            with ZipFile( CACHE.fetch( url ) ) as zfile:
+                bad = zfile.testzip()
+        except ( URLError, CacheMissError ) as exc:
+            print( f' Prefetch of {url} failed: {exc}' )
+            return False
+        except BadZipFile:
+            print( f' Prefetch of {url}: not a zip archive; discarded.' )
+        else:
+            if bad is None:
+                return True
+            print( f' Prefetch of {url}: corrupt member {bad}; discarded.' )
+        CACHE.discard( url )
+    return False
+
+
+def run_archives_asyncio( archives, handler, concurrency=None, live=True ):
+    '''Function to fetch archives into the download cache with an asyncio
+    engine and hand each one to a worker pool as soon as it is complete.
+
+    "archives" is a list of ( url, *args ); handler( url, *args ) runs in
+    the pool once "url" is in the cache, e.g. install_theme_font_or_gsextension
+    to extract it. Up to "concurrency" (default ASYNC_DOWNLOADS) archives are
+    streamed at the same time, no more than HTTP_STREAMS_PER_HOST of them from
+    one host, and an url listed twice is fetched once. A DownloadProgress
+    line is shown while they download; it is only rewritten in place when
+    "live", i.e. when nothing else prints at the same time.
+
+    A failed download is raised by the CACHE.fetch() of handler, so handler
+    deals with it as if it had downloaded "url" itself. Returns the results
+    of handler, in the order of "archives". Raises the first error of
+    handler.'''
+    import asyncio
+    import concurrent.futures as cf
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop( loop ) #the phases run in worker threads, which have no loop
+    try:
+        with cf.ThreadPoolExecutor() as executor:
+            return loop.run_until_complete( _run_archives( archives, PROFILER.bind( handler ),
+                                                           concurrency or ASYNC_DOWNLOADS, executor, live ) )
+    finally:
+        asyncio.set_event_loop( None )
+        loop.close()
+
+
+async def _run_archives( archives, handler, concurrency, executor, live ):
+    import asyncio
+    loop = asyncio.get_event_loop()
+    limit = asyncio.Semaphore( concurrency )
+    hosts = {}          # host -> asyncio.Semaphore
+    downloads = {}      # url -> Future of its download
+    progress = DownloadProgress( len( { archive[0] for archive in archives } ), live )
+
+    async def fetch( url ):
+        try:
+            path, headers = CACHE.begin( url )
+            if path is not None:
+                return
+            CACHE.objects.mkdir( parents=True, exist_ok=True )
+            host = hosts.setdefault( urlsplit( url ).hostname,
+                                     asyncio.Semaphore( HTTP_STREAMS_PER_HOST ) )
+            async with host, limit: #a queue for one host must not hold the slots of others
+                try:
+                    spool, response_headers = await download_async( url, CACHE.objects, headers,
+                                                                    progress=progress )
+                except DownloadError as e:
+                    try:
+                        CACHE.fallback( url, e )
+                    except DownloadError:
+                        CACHE.failed( url, e ) #handler reports it, like with the threads engine
+                    return
+            await loop.run_in_executor( executor, CACHE.store, url, spool, response_headers )
+        finally:
+            progress.done( url )
+
+    async def one( url, *args ):
+        if url not in downloads:
+            downloads[ url ] = asyncio.ensure_future( fetch( url ) )
+        await downloads[ url ]
+        return await loop.run_in_executor( executor, handler, url, *args )
+
+    async def show():
+        while True:
+            progress.show()
+            await asyncio.sleep( PROGRESS_INTERVAL )
+
+    display = asyncio.ensure_future( show() )
+    tasks = [ asyncio.ensure_future( one( *archive ) ) for archive in archives ]
+    try:
+        return await asyncio.gather( *tasks )
+    finally:
+        pending = tasks + list( downloads.values() ) + [ display ]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather( *pending, return_exceptions=True )
+        progress.show( final=True )
+
+
+def _use_asyncio( urls ):
+    '''Return whether "urls" are fetched with run_archives_asyncio(), i.e.
+    DOWNLOAD_ENGINE is 'asyncio', the cache may access the network and no
+    proxy is configured for them; the asyncio engine connects directly only.'''
+    from urllib.request import getproxies, proxy_bypass
+    if DOWNLOAD_ENGINE != 'asyncio' or CACHE.offline:
+        return False
+    proxies = getproxies()
+    if any( proxies.get( urlsplit( url ).scheme ) and not proxy_bypass( urlsplit( url ).hostname )
+            for url in urls ):
+        print( ' A proxy is configured; using the threads download engine.' )
+        return False
+    return True
+
+
+def start_prefetch():
+    '''Start prefetch_downloads() in the background and return its Future.
+    The profile reports it as "prefetch_downloads (background)", from its
+    start to its end; the prefetch_downloads phase only waits for it.'''
+    import concurrent.futures as cf
+    name = 'prefetch_downloads (background)'
+
+    def prefetch():
+        start = time.monotonic()
+        try:
+            prefetch_downloads( live=False )
+        finally:
+            PROFILER.span( name, start, time.monotonic() )
+
+    executor = cf.ThreadPoolExecutor( max_workers=1 )
+    future = executor.submit( PROFILER.bind( prefetch, name ) )
+    executor.shutdown( wait=False )
+    return future
+
+
+def enable_sudo_gsextensions():
+    '''Manually enable GNOME Shell extensions that were installed via "sudo apt-get install gnome-shell-extensions".'''
+    sudo_gsextensions = [ 'user-theme@gnome-shell-extensions.gcampax.github.com',
+                          'workspace-indicator@gnome-shell-extensions.gcampax.github.com',
+                          'drive-menu@gnome-shell-extensions.gcampax.github.com',
+                          'dash-to-dock@micxgx.gmail.com' ]
+    for ext in sudo_gsextensions:
+        if Path( f'/usr/share/gnome-shell/extensions/{ext}' ).exists():
+            run( f'gnome-shell-extension-tool -e {ext}', shell=True)
+
+
 def install_theme_font_or_gsextension( url, dst ):
-    '''Function to install a Gnome-shell theme, font or extension from a given "url" to a destination folder "dst".'''
+    '''Function to install a Gnome-shell theme, font or extension from a given "url" to a destination folder "dst".
+    Returns None when "url" is not in the download cache with --offline.'''
+    from zipfile import ZipFile
 
     def get_gsextension_uuid( file ):
         '''Get UUID from the metadata of a GNOME shell extension. \
@@ -318,66 +1675,451 @@ def install_theme_font_or_gsextension( url, dst ):
             return gsextension_uuid
 
     #print( f'\nProcess {os.getpid()} {current_thread()}  Installing {os.path.basename(url)}' )
-    response = get_url_response( url )
+    record = JOURNAL.artifact( url )
+    if ( record and record['sha256'] == CACHE.cached_sha256( url ) and
+         all( Path( p ).exists() for p in record['paths'] ) ):
+        return record['output'] #Installed by an earlier, resumed run
     if 'zip' in url:
         #print( f'zip file { os.path.basename(url)} detected.' )
-        with ZipFile( BytesIO( response.read() ) ) as zfile:
+        try:
+            archive = CACHE.fetch( url )
+        except CacheMissError as exc: #--offline
+            print( f' Skipped {url}: {exc}' )
+            return None
+        with ZipFile( archive ) as zfile:
             if 'extensions.gnome.org' in url:
                 uuid = get_gsextension_uuid( zfile )
                 #print( 'uuid = ', uuid )
                 destination = dst / uuid
                 if destination.is_dir():
                     rmtree( destination )
-                zfile.extractall( path=destination )
+                extract_zip( archive, destination )
                 output = uuid
+                paths = [ destination ]
                 copy_gs_extensions_schema_to_glib2_schemas( uuid )
                 run( f'gnome-shell-extension-tool -e {uuid}', shell=True )
             else:
-                zfile.extractall( path=dst )
+                names = extract_zip( archive, dst, members=_archive_filter( url ) )
+                paths = { dst / name.split( '/' )[0] for name in names }
                 folder = Path( url )
                 if folder.name in 'macfonts.zip':
                     output = 'macfonts.zip'
                 else:
                     output = folder.parents[1].name + '-' + folder.name
     else:
-        response.close()
         raise ValueError( f'Extension must have a ".zip" url.' )
+    JOURNAL.mark_artifact( url, archive.name, paths, output )
     
-    response.close()
     #print( f'Process {os.getpid()} {current_thread()}  Installing {os.path.basename(url)} is completed. \n-->output={output}' )
     return output
 
 
-def get_url_response( url ):
-    req = Request( url )
-    try:
-        response = urlopen( req )
-    except URLError as e:
-        if hasattr( e, 'reason' ):
-            print( 'We failed to reach a server.' )
-            print( 'Reason: ', e.reason )
+def extract_zip( archive, dst, members=None, jobs=None ):
+    '''Function to extract zip file "archive" into directory "dst" like
+    ZipFile.extractall(), with its members spread over up to "jobs" threads
+    (default EXTRACT_JOBS).
+
+    The central directory is read once. The whole directory tree is created
+    in one pass, then the files are split into groups of about equal size and
+    each group is extracted by a worker with its own ZipFile handle. Unix
+    permissions recorded in the archive are preserved. "members", if given,
+    is a function of a zipfile.ZipInfo that returns whether to extract it.
+    Returns the names of the extracted members.'''
+    from zipfile import ZipFile
+    jobs = jobs or EXTRACT_JOBS
+    dst = Path( dst )
+    with ZipFile( archive ) as zfile:
+        infos = zfile.infolist()
+    if members is not None:
+        selected = [ info for info in infos if members( info ) ]
+        if any( not info.filename.endswith( '/' ) for info in selected ):
+            infos = selected
+        else: #the archive layout changed; better too much than nothing
+            print( f' No member of {archive} passed the filter; extracting all of them.' )
+
+    #1. Create the directory tree
+    folders = { dst: None }  # path -> ZipInfo of the directory member, if any
+    files = []
+    for info in infos:
+        path = _member_path( dst, info.filename )
+        if path is None:
+            continue
+        if info.filename.endswith( '/' ):
+            folders[ path ] = info
+        else:
+            folders.setdefault( path.parent, None )
+            files.append( ( info, path ) )
+    for folder in sorted( folders ): #parents sort before their children
+        folder.mkdir( parents=True, exist_ok=True )
+
+    #2. Extract the files, in groups of about equal size when there are many
+    if len( files ) < EXTRACT_MIN_MEMBERS or jobs == 1:
+        _extract_members( archive, files )
     else:
-        # everything is fine
-        #print( 'response obtained.', url)
-        #print( 'response.geturl()')
-        #print( 'response.info()')
-        #print( 'response.getcode()')
+        groups = [ [] for _ in range( jobs ) ]
+        loads = [ 0 ] * jobs
+        for member in sorted( files, key=lambda member: member[0].file_size, reverse=True ):
+            i = loads.index( min( loads ) )
+            groups[i].append( member )
+            loads[i] += member[0].file_size + 4096 #a file costs syscalls too
+        pool = _extract_pool()
+        futures = [ pool.submit( PROFILER.bind( _extract_members ), archive, group )
+                    for group in groups if group ]
+        for future in futures:
+            future.result()
+
+    #3. Set directory permissions last, in case they forbid writing
+    for folder, info in folders.items():
+        mode = info and _member_mode( info )
+        if mode:
+            os.chmod( str(folder), mode )
+    return [ info.filename for info in infos ]
+
+
+def member_filter( include=(), exclude=(), depth=None, anywhere=() ):
+    '''Function to return a function of a zipfile.ZipInfo that is True when
+    its lower-cased name matches a pattern of "include" (if any is given)
+    and no pattern of "exclude" or "anywhere". With "depth", the exclude
+    patterns are only matched against the first "depth" levels of the name,
+    e.g. 'theme/docs' of 'theme/docs/a.png'; "anywhere" patterns are always
+    matched against the whole name. Directories only pass when they match; the
+    directories of the selected files are created by extract_zip() anyway.'''
+    def selected( info ):
+        name = info.filename.lower()
+        if include and not any( fnmatchcase( name, pattern ) for pattern in include ):
+            return False
+        if any( fnmatchcase( name, pattern ) for pattern in anywhere ):
+            return False
+        if depth:
+            name = '/'.join( name.split( '/', depth )[:depth] )
+        return not any( fnmatchcase( name, pattern ) for pattern in exclude )
+    return selected
+
+
+def _extract_members( archive, members ):
+    '''Extract the (ZipInfo, path) pairs "members" of zip file "archive"
+    through a ZipFile handle of this thread.'''
+    from zipfile import ZipFile
+    with ZipFile( archive ) as zfile:
+        for info, path in members:
+            with zfile.open( info ) as src, open( str(path), 'wb' ) as dst:
+                copyfileobj( src, dst, CHUNK_SIZE )
+            mode = _member_mode( info )
+            if mode:
+                os.chmod( str(path), mode )
+
+
+def _member_path( dst, name ):
+    '''Return where member "name" is extracted in "dst", without absolute,
+    "." and ".." components as ZipFile.extract() does; None for the root.'''
+    parts = [ part for part in name.replace( '\\', '/' ).split( '/' )
+              if part not in ( '', '.', '..' ) ]
+    return dst.joinpath( *parts ) if parts else None
+
+
+def _member_mode( info ):
+    '''Return the permission bits a zip member was created with on Unix, or
+    None. Symbolic links are extracted as files, as ZipFile does, so their
+    bits are ignored.'''
+    if info.create_system != 3: #not made on Unix
+        return None
+    mode = info.external_attr >> 16
+    if stat.S_IFMT( mode ) in ( 0, stat.S_IFREG, stat.S_IFDIR ):
+        return stat.S_IMODE( mode ) or None
+    return None
+
+
+def _extract_pool():
+    global EXTRACT_POOL
+    import concurrent.futures as cf
+    with EXTRACT_POOL_LOCK:
+        if EXTRACT_POOL is None:
+            EXTRACT_POOL = cf.ThreadPoolExecutor( max_workers=EXTRACT_JOBS )
+    return EXTRACT_POOL
+
+
+def download( url, dst_dir, headers=None, retries=None ):
+    '''Function to download "url" into a Spool in "dst_dir", sending the
+    extra request "headers".
+
+    A failed request or an interrupted body is retried up to "retries" times
+    (default DOWNLOAD_RETRIES) after an exponential backoff with jitter. An
+    interrupted body is resumed with a Range request when the server gave a
+    validator for If-Range, so the bytes already received are kept; if the
+    server answers with the whole body instead, it is collected anew. A body
+    shorter than its Content-Length counts as interrupted.
+
+    Returns ( Spool, response headers ). Raises HTTPStatusError for a status
+    other than 2xx, e.g. 304 to a conditional request, IncompleteDownloadError
+    or DownloadError when the last retry failed too.'''
+    import http.client
+    retries = DOWNLOAD_RETRIES if retries is None else retries
+    spool = Spool( dst_dir )
+    validator = None    # ETag or Last-Modified of the body being collected
+
+    def collect( response ):
+        '''Read "response" into spool; return None if the body is complete,
+        else the error.'''
+        nonlocal validator
+        start = _content_range_start( response )
+        if start is None:
+            spool.reset()
+            validator = _range_validator( response )
+        elif start != spool.size:
+            received = spool.size
+            spool.reset()
+            validator = None #start over without Range
+            return DownloadError( url, f'Content-Range starts at byte {start}, not {received}' )
+        elif start:
+            print( f' Resuming {url} at byte {start:,d}.' )
+        expected = _content_length( response, spool.size )
+        try:
+            for chunk in iter( lambda: response.read( CHUNK_SIZE ), b'' ):
+                spool.write( chunk )
+        except ( http.client.HTTPException, OSError ) as e:
+            return DownloadError( url, f'interrupted after {spool.size:,d} bytes: {e!r}' )
+        if expected is not None and spool.size != expected:
+            return IncompleteDownloadError( url, spool.size, expected )
+        return None
+
+    attempt = 0
+    try:
+        while True:
+            request_headers = dict( headers or {} )
+            if spool.size and validator:
+                request_headers.update( { 'Range': f'bytes={spool.size}-', 'If-Range': validator } )
+            try:
+                response = HTTP.request( url, request_headers )
+            except HTTPError as e:
+                error = HTTPStatusError( url, e.code, e.reason, e.headers )
+                if e.code not in RETRY_STATUSES:
+                    raise error from e
+            except URLError as e:
+                error = DownloadError( url, e.reason )
+            else:
+                with response:
+                    error = collect( response )
+                    if error is None:
+                        return spool, response.headers
+            if attempt >= retries:
+                raise error
+            attempt += 1
+            delay = _retry_delay( attempt, getattr( error, 'headers', None ) )
+            print( f' Retrying {url} in {delay:.1f} sec ({attempt}/{retries}): {error.reason}' )
+            time.sleep( delay )
+    except BaseException:
+        spool.discard()
+        raise
+
+
+def _retry_delay( attempt, headers=None ):
+    '''Return the seconds to wait before retry "attempt": the Retry-After of
+    the failed response, if it gave one in seconds, else an exponential
+    backoff with equal jitter, both capped at DOWNLOAD_BACKOFF_MAX.'''
+    retry_after = headers.get( 'Retry-After', '' ) if headers else ''
+    if retry_after.strip().isdigit():
+        return min( float( retry_after ), DOWNLOAD_BACKOFF_MAX )
+    backoff = min( DOWNLOAD_BACKOFF * 2 ** ( attempt - 1 ), DOWNLOAD_BACKOFF_MAX )
+    return backoff / 2 + random.uniform( 0, backoff / 2 )
+
+
+def _range_validator( response ):
+    '''Return the validator of "response" to resume its body with If-Range,
+    or None if it cannot be resumed safely. A weak ETag cannot be used.'''
+    if response.getheader( 'Accept-Ranges', '' ).strip().lower() == 'none':
+        return None
+    etag = response.getheader( 'ETag' )
+    if etag and not etag.startswith( 'W/' ):
+        return etag
+    return response.getheader( 'Last-Modified' )
+
+
+def _content_range_start( response ):
+    '''Return the first byte position of a 206 "response", else None.'''
+    if response.status != 206:
+        return None
+    match = re.match( r'bytes\s+(\d+)-\d+/', response.getheader( 'Content-Range', '' ) )
+    return int( match.group(1) ) if match else None
+
+
+def _content_length( response, size ):
+    '''Return the size the complete body of "response" must have, or None
+    if it is unknown; "size" bytes of it were received earlier when it is a
+    resumed (206) response.'''
+    if response.status == 206:
+        match = re.match( r'bytes\s+\d+-\d+/(\d+)', response.getheader( 'Content-Range', '' ) )
+        if match:
+            return int( match.group(1) )
+    length = response.getheader( 'Content-Length' )
+    if length is None or not length.strip().isdigit():
+        return None
+    return int( length ) + ( size if response.status == 206 else 0 )
+
+
+async def request_async( url, headers=None, max_redirects=5 ):
+    '''Coroutine to send a GET request of "url" over asyncio streams,
+    following redirects, and return its AsyncResponse. Each request opens its
+    own connection, which closing the response closes. Raises
+    HTTPStatusError for a status other than 2xx and DownloadError when the
+    server cannot be reached or its answer cannot be parsed.'''
+    import asyncio
+    import email.parser
+    import http.client
+    headers = dict( { 'User-Agent': f'revamp1804/{__version__}' }, **( headers or {} ) )
+    for _ in range( max_redirects + 1 ):
+        ( scheme, host, port ), path = HTTPPool._split( url )
+        context = None
+        if scheme == 'https':
+            import ssl
+            context = ssl.create_default_context()
+        try:
+            reader, writer = await asyncio.wait_for( asyncio.open_connection(
+                host, port, ssl=context, server_hostname=host if context else None ), HTTP_TIMEOUT )
+        except ( OSError, asyncio.TimeoutError ) as e:
+            raise DownloadError( url, f'cannot connect: {e!r}' ) from e
+        try:
+            netloc = host if port == ( 443 if context else 80 ) else f'{host}:{port}'
+            lines = [ f'GET {path} HTTP/1.1', f'Host: {netloc}', 'Accept-Encoding: identity',
+                      'Connection: close' ] + [ f'{k}: {v}' for k, v in headers.items() ]
+            writer.write( ( '\r\n'.join( lines ) + '\r\n\r\n' ).encode( 'latin-1' ) )
+            head = await asyncio.wait_for( reader.readuntil( b'\r\n\r\n' ), HTTP_TIMEOUT )
+            status_line, _, fields = head.decode( 'latin-1' ).partition( '\r\n' )
+            _, status, reason = ( status_line.split( None, 2 ) + [ '' ] )[:3]
+            status = int( status )
+        except ( OSError, ValueError, asyncio.TimeoutError,
+                 asyncio.IncompleteReadError, asyncio.LimitOverrunError ) as e:
+            writer.close()
+            raise DownloadError( url, f'no valid response: {e!r}' ) from e
+        fields = email.parser.Parser( _class=http.client.HTTPMessage ).parsestr( fields )
+        response = AsyncResponse( url, status, reason.strip(), fields, reader, writer )
+        location = response.getheader( 'Location' )
+        if status in HTTPPool.REDIRECTS and location:
+            response.close()
+            url = urljoin( url, location )
+            continue
+        if not 200 <= status < 300:
+            response.close()
+            raise HTTPStatusError( url, status, response.reason, fields )
         return response
+    raise DownloadError( url, f'more than {max_redirects} redirects' )
+
+
+async def download_async( url, dst_dir, headers=None, retries=None, progress=None ):
+    '''Coroutine version of download(), on request_async(): the same
+    retries, backoff and Range/If-Range resumption, and the same return
+    value and errors. The bytes received are counted in "progress", a
+    DownloadProgress, if given.'''
+    import asyncio
+    retries = DOWNLOAD_RETRIES if retries is None else retries
+    spool = Spool( dst_dir )
+    validator = None    # ETag or Last-Modified of the body being collected
+
+    async def collect( response ):
+        '''Read "response" into spool; return None if the body is complete,
+        else the error.'''
+        nonlocal validator
+        start = _content_range_start( response )
+        if start is None:
+            spool.reset()
+            validator = _range_validator( response )
+        elif start != spool.size:
+            received = spool.size
+            spool.reset()
+            validator = None #start over without Range
+            return DownloadError( url, f'Content-Range starts at byte {start}, not {received}' )
+        elif start:
+            print( f' Resuming {url} at byte {start:,d}.' )
+        expected = _content_length( response, spool.size )
+        if progress:
+            progress.expect( url, expected, spool.size )
+        try:
+            async for chunk in response.chunks( CHUNK_SIZE ):
+                spool.write( chunk )
+                if progress:
+                    progress.advance( url, len( chunk ) )
+        except ( OSError, ValueError, asyncio.TimeoutError ) as e:
+            return DownloadError( url, f'interrupted after {spool.size:,d} bytes: {e!r}' )
+        if expected is not None and spool.size != expected:
+            return IncompleteDownloadError( url, spool.size, expected )
+        return None
+
+    attempt = 0
+    try:
+        while True:
+            request_headers = dict( headers or {} )
+            if spool.size and validator:
+                request_headers.update( { 'Range': f'bytes={spool.size}-', 'If-Range': validator } )
+            try:
+                response = await request_async( url, request_headers )
+            except HTTPStatusError as e:
+                error = e
+                if e.code not in RETRY_STATUSES:
+                    raise
+            except DownloadError as e:
+                error = e
+            else:
+                try:
+                    error = await collect( response )
+                finally:
+                    response.close()
+                if error is None:
+                    return spool, response.headers
+            if attempt >= retries:
+                raise error
+            attempt += 1
+            delay = _retry_delay( attempt, getattr( error, 'headers', None ) )
+            print( f' Retrying {url} in {delay:.1f} sec ({attempt}/{retries}): {error.reason}' )
+            await asyncio.sleep( delay )
+    except BaseException:
+        spool.discard()
+        raise
 
 
 def copy_gs_extensions_schema_to_glib2_schemas( uuid ):
-    '''Copy schema_in_extension to schema_in_glib_schema, and compiles glib schemas.'''
+    '''Copy schema_in_extension to schema_in_glib_schema, unless an identical
+    schema is already there. compile_glib2_schemas() compiles them.'''
     # Get schema of extension
     try:
-        ext_schema_path = Path( next( Path( f'{GSEXTENSIONS}/{uuid}/schemas' ).glob('*.gschema.xml') ) )
+        ext_schema_path = Path( next( Path( f'{CONFIG.gsextensions}/{uuid}/schemas' ).glob('*.gschema.xml') ) )
     except StopIteration:
         pass
     else:
         ext_schema_name = ext_schema_path.name                 # Get schema name
-        ext_glib_schema_path = GLIB2_SCHEMAS / ext_schema_name # Create schema's path to glib_2.0/schemas directory
+        ext_glib_schema_path = CONFIG.glib2_schemas / ext_schema_name # Create schema's path to glib_2.0/schemas directory
+        if ( ext_glib_schema_path.is_file() and
+             file_sha256( ext_glib_schema_path ) == file_sha256( ext_schema_path ) ):
+            return                                             # Identical schema is already there
         copy2( ext_schema_path, ext_glib_schema_path )         # Copy schema to glib_2.0/schemas directory
 
 
+def compile_glib2_schemas():
+    '''Run glib-compile-schemas on CONFIG.glib2_schemas only when its set of
+    input files, i.e. *.gschema.xml, *.enums.xml and *.gschema.override, and
+    their hashes differ from the set that was last compiled, which is
+    recorded in GLIB2_SCHEMAS_DIGEST. Returns True if it compiled.'''
+    schemas = sorted( path for pattern in GLIB2_SCHEMAS_INPUTS
+                      for path in CONFIG.glib2_schemas.glob( pattern ) )
+    digest = hashlib.sha256()
+    for schema in schemas:
+        digest.update( f'{schema.name} {file_sha256(schema)}\n'.encode() )
+    digest = digest.hexdigest()
+    record = CONFIG.glib2_schemas / GLIB2_SCHEMAS_DIGEST
+    compiled = CONFIG.glib2_schemas / 'gschemas.compiled'
+    if compiled.is_file() and record.is_file() and record.read_text().strip() == digest:
+        print( f'\n{len(schemas)} schema files in {CONFIG.glib2_schemas} are unchanged; skipped glib-compile-schemas.' )
+        return False
+    result = run( ['glib-compile-schemas', CONFIG.glib2_schemas], stdout=sys.stdout )
+    if result.returncode == 0:
+        atomic_write( record, digest + '\n' )
+    return True
+
+
+def makedirs( *folders ):
+    '''Function to create the directories in "folders" that do not exist.'''
+    for folder in folders:
+        folder.mkdir( mode=0o777, parents=True, exist_ok=True )
+
+
 def configure_GNOME_Shell_extensions():
     print( '\nConfiguring GNOME Shell Extensions ...' )
     
@@ -433,7 +2175,19 @@ def gsettings_set( schema, keys_values ):
     Arguments:
     - "schema" is a string object.
     - "keys_values" is a list object containing pairs of key and value that are encased in a list.
+
+    Inside a gsettings_batch() block the writes are only queued; they are
+    applied together when the outermost block ends.
     '''
+    with GSETTINGS_LOCK:
+        if GSETTINGS_BATCH is not None:
+            GSETTINGS_BATCH.extend( [ schema, kv[0], kv[1] ] for kv in keys_values )
+            return
+    _gsettings_set_cmd( schema, keys_values )
+
+
+def _gsettings_set_cmd( schema, keys_values ):
+    '''Run one "gsettings set" process per key/value pair.'''
     for kv in keys_values:
         try:
             cmd = f'gsettings set {schema} {kv[0]} {kv[1]}'
@@ -443,6 +2197,124 @@ def gsettings_set( schema, keys_values ):
             print(exc)
 
 
+def gsettings_get( schema, key ):
+    '''Mimics bash "gsettings get" command. A value that is still queued in an
+    open gsettings_batch() is returned instead of the stored one.'''
+    with GSETTINGS_LOCK:
+        for pschema, pkey, pvalue in reversed( GSETTINGS_BATCH or [] ):
+            if pschema == schema and pkey == key:
+                return str( pvalue )
+    return run( [ 'gsettings', 'get', schema, key ],
+                stdout=PIPE, encoding='utf8' ).stdout.rstrip()
+
+
+@contextmanager
+def gsettings_batch():
+    '''Context manager to collect every gsettings_set() made inside it and
+    apply them in one transaction when it exits, or earlier with
+    gsettings_flush(). Nested blocks join the outermost one.
+
+    Note: "dconf reset -f" calls are not queued; they still run at once, i.e.
+    before the queued writes of the same block.
+    '''
+    global GSETTINGS_BATCH
+    with GSETTINGS_LOCK:
+        outermost = GSETTINGS_BATCH is None
+        if outermost:
+            GSETTINGS_BATCH = []
+    try:
+        yield
+    finally:
+        if outermost:
+            with GSETTINGS_LOCK:
+                writes, GSETTINGS_BATCH = GSETTINGS_BATCH, None
+            _gsettings_apply_batch( writes )
+
+
+def gsettings_flush():
+    '''Apply the writes queued so far by the open gsettings_batch(), if any,
+    in one transaction; the batch stays open. run_phases() calls it when a
+    phase ends, so that a phase is journaled as completed only once its
+    settings are written.'''
+    global GSETTINGS_BATCH
+    with GSETTINGS_LOCK:
+        if not GSETTINGS_BATCH:
+            return
+        writes, GSETTINGS_BATCH = GSETTINGS_BATCH, []
+    _gsettings_apply_batch( writes )
+
+
+def _gsettings_apply_batch( writes ):
+    if writes:
+        print( f'\nApplying {len(writes)} gsettings in one transaction ...' )
+        gsettings_apply( writes )
+        print( f'Applying {len(writes)} gsettings in one transaction ... Done.' )
+
+
+def gsettings_apply( writes ):
+    '''Apply a list of [schema, key, value] writes through one in-process
+    GSettings session per schema. Every session is delayed, applied once and
+    then synced to dconf in a single write. Per-key failures are printed, like
+    gsettings_set() does. Falls back to "gsettings set" when PyGObject is not
+    available or when a schema is unknown to this process.'''
+    try:
+        import gi
+        gi.require_version( 'Gio', '2.0' )
+        from gi.repository import Gio, GLib
+    except ( ImportError, ValueError ):
+        for schema, key, value in writes:
+            _gsettings_set_cmd( schema, [ [key, value] ] )
+        return
+
+    source = Gio.SettingsSchemaSource.get_default()
+    sessions = {}
+    fallback = []
+    for schema, key, value in writes:
+        print( f' gsettings set {schema} {key} {value}' )
+        if schema not in sessions:
+            schema_id, _, path = schema.partition( ':' )
+            if source is None or source.lookup( schema_id, True ) is None:
+                sessions[schema] = None
+            else:
+                if path:
+                    settings = Gio.Settings.new_with_path( schema_id, path )
+                else:
+                    settings = Gio.Settings.new( schema_id )
+                settings.delay()
+                sessions[schema] = settings
+        settings = sessions[schema]
+        if settings is None:
+            fallback.append( [ schema, key, value ] )
+            continue
+        sschema = settings.props.settings_schema
+        if not sschema.has_key( key ):
+            print( f'No such key "{key}" in schema "{schema}"' )
+            continue
+        skey = sschema.get_key( key )
+        vtype = skey.get_value_type()
+        try:
+            variant = GLib.Variant.parse( vtype, str(value), None, None )
+        except GLib.Error as exc:
+            if vtype.dup_string() != 's':
+                print( f'{schema} {key}: {exc.message}' )
+                continue
+            variant = GLib.Variant( 's', str(value) ) #gsettings also accepts unquoted strings
+        if not skey.range_check( variant ):
+            print( f'{schema} {key}: value {value} is outside of the valid range' )
+            continue
+        settings.set_value( key, variant )
+
+    for settings in sessions.values():
+        if settings is not None:
+            settings.apply()
+    Gio.Settings.sync()
+
+    #Schemas compiled after this process loaded its schema source are not
+    #visible to it; let "gsettings" look them up.
+    for schema, key, value in fallback:
+        _gsettings_set_cmd( schema, [ [key, value] ] )
+
+
 def configure_user_theme():
     print( '\n Configuring user-theme ...' )
     gsettings_set( 'org.gnome.shell.extensions.user-theme', [ ['name','Sierra-light'] ] )
@@ -483,34 +2355,38 @@ def configure_ubuntu_dock():
 
 
 def configure_arc_menu():
+    from zipfile import ZipFile
     print( '\n Configuring arc-menu ...' )
     #1. Reset to default
     run( [ 'dconf', 'reset', '-f', '/org/gnome/shell/extensions/arc-menu' ],
          stdout=sys.stdout )
 
     #2. Get user-theme name
-    theme = run( [ 'gsettings', 'get', 'org.gnome.shell.extensions.user-theme',
-                   'name' ], stdout=PIPE ).stdout.decode().rstrip()
+    theme = gsettings_get( 'org.gnome.shell.extensions.user-theme', 'name' )
 
     #3. Get icon corresponding to theme
-    url = 'https://assets.ubuntu.com/v1/9fbc8a44-circle-of-friends-web.zip'
+    url = _arc_menu_icon_url()
     sl = Path( '/usr/share/themes/Sierra-light/gnome-shell/assets/activities.svg' )
     sd = Path( '/usr/share/themes/Sierra-dark/gnome-shell/assets/activities.svg' )
-    response = get_url_response( url )
-    if 'zip' in url:
+    try:
+        archive = CACHE.fetch( url )
+    except ( URLError, CacheMissError ) as exc:
+        print( f' Unable to get {url}: {exc}' )
+        archive = None
+    if archive and 'zip' in url:
         #print( f'zip file { os.path.basename(url)} detected.' )
-        with ZipFile( BytesIO( response.read() ) ) as zfile:
+        with ZipFile( archive ) as zfile:
             try:
                 #print( zfile.namelist() )
                 zfile.extract( 'circle-of-friends-web/PNG/cof_orange_hex.png',
-                               path=ICONS )
+                               path=CONFIG.icons )
             except Exception:
                 if theme in 'Sierra-light':
                     src = sl
                 elif theme in 'Sierra-dark':
                     src = sd
             else:
-                src = ICONS/'circle-of-friends-web'/'PNG'/'cof_orange_hex.png'
+                src = CONFIG.icons/'circle-of-friends-web'/'PNG'/'cof_orange_hex.png'
     else:
         if theme in 'Sierra-light':
             src = sl
@@ -655,27 +2531,48 @@ def configure_gnome_terminal():
     print( ' Configuring gnome-terminal ... Done.' )
 
 
+def rewrite_symbolstyle( xcu, styles, new ):
+    '''Function to set the LibreOffice icon style in the registry file "xcu"
+    to "new" wherever it is currently one of "styles".
+
+    The file is streamed line by line into a temporary file next to it; one
+    compiled pattern matches every candidate style. The temporary file only
+    replaces "xcu" when a line was changed. Returns True if "xcu" changed.'''
+    pattern = re.compile(
+        r'("SymbolStyle" oor:op="fuse"><value>)(?:'
+        + '|'.join( re.escape( style ) for style in styles )
+        + r')(</value></prop></item>)' )
+    replacement = lambda match: match.group(1) + new + match.group(2)
+    changed = False
+    with open( xcu, 'r', encoding='utf-8', newline='' ) as src, \
+         NamedTemporaryFile( 'w', encoding='utf-8', newline='', dir=str(xcu.parent),
+                             prefix=f'.{xcu.name}.', suffix='.tmp', delete=False ) as dst:
+        for line in src:
+            line, count = pattern.subn( replacement, line )
+            changed = changed or count > 0
+            dst.write( line )
+    try:
+        if changed:
+            os.chmod( dst.name, os.stat( str(xcu) ).st_mode & 0o7777 )
+            atomic_replace( dst.name, xcu )
+    finally:
+        if os.path.exists( dst.name ):
+            os.unlink( dst.name )
+    return changed
+
+
 def configure_libreoffice():
     print( '\n Configuring libreoffice ...' )
-    
-    def symbolstyle_phrase( style ):
-        return f'"SymbolStyle" oor:op="fuse"><value>{style}</value></prop></item>'
-
-    lbxcu = HOME/'.config'/'libreoffice'/'4'/'user'/'registrymodifications.xcu'
+    lbxcu = CONFIG.home/'.config'/'libreoffice'/'4'/'user'/'registrymodifications.xcu'
     symbolstyles = [ 'auto', 'sifr_dark', 'tango', 'breeze', 'galaxy', 'breeze_dark' ]
     if lbxcu.exists():
         backup = Path( str(lbxcu) + '.bak' )
         if not backup.exists(): #Do not replace if registrymodifications.xcu.bak exists.
             copy2( lbxcu, backup )
-        with open( lbxcu, 'r' ) as file:
-            filedata = file.read()
-        for style in symbolstyles:
-            phrase = symbolstyle_phrase(style)
-            if filedata.find( phrase ) != -1: #detected phrase
-                filedata = filedata.replace( phrase, symbolstyle_phrase('sifr') ) #replace phrase
-                break
-        with open( lbxcu, 'w' ) as file:
-            file.write( filedata )
+        if rewrite_symbolstyle( lbxcu, symbolstyles, 'sifr' ):
+            print( '  Replaced icon style with "sifr".' )
+        else:
+            print( '  Icon style unchanged.' )
         print( ' Configuring libreoffice ... Done.' )
     else:
         print( ' Configuring libreoffice ... Not Done.' )
@@ -693,45 +2590,280 @@ def configure_nautilus():
 
 def install_nautilus_script_Revamp_Wallpaper():
     print( '\n Installing nautilus script "Revamp Wallpaper" ...' )
-    src = INSTALLER_DIR / Path('resources/nautilus/Revamp Wallpaper')
-    dst = HOME / Path('.local/share/nautilus/scripts/Revamp Wallpaper')
+    src = CONFIG.installer_dir / Path('resources/nautilus/Revamp Wallpaper')
+    dst = CONFIG.home / Path('.local/share/nautilus/scripts/Revamp Wallpaper')
     copy2( src, dst )
     dst.chmod(0o771)    
     print( ' Installing nautilus script "Revamp Wallpaper" ... Done.' )
 
     
 def configure_Desktop_and_Lockscreen_Wallpaper():
+    from zipfile import ZipFile
     print( '\nConfiguring Desktop Wallpaper and Screensaver...' )
-    #1. Unzip and extractall images to BACKGROUNDS
-    with ZipFile( INSTALLER_DIR / Path('resources/backgrounds/Sierra-wallpapers.zip' ), 'r' ) as zfile:
-       zfile.extractall( BACKGROUNDS )
-
-    #2. Configure desktop wallpaper
-    sierra = BACKGROUNDS / Path('Sierra-wallpapers/Sierra2.jpg')
-    wallpaper = BACKGROUNDS/'wallpaper.jpg'
-    copy2( sierra, wallpaper )
+    makedirs( CONFIG.backgrounds, CONFIG.gbackgrounds_properties )
+    #1. Unzip and extractall images to CONFIG.backgrounds
+    with ZipFile( CONFIG.installer_dir / Path('resources/backgrounds/Sierra-wallpapers.zip' ), 'r' ) as zfile:
+       zfile.extractall( CONFIG.backgrounds )
+
+    #2. Configure desktop wallpaper with the variant of sierra that is
+    #   pre-scaled for the largest monitor
+    sierra = CONFIG.backgrounds / Path('Sierra-wallpapers/Sierra2.jpg')
+    variants = wallpaper_variants( sierra )
+    variant = next( iter( variants.values() ), sierra )
+    wallpaper = CONFIG.backgrounds/f'wallpaper{variant.suffix}'
+    sync_file( variant, wallpaper )
     #run( f'gsettings set org.gnome.desktop.background picture-uri file://{wallpaper}',
     gsettings_set( 'org.gnome.desktop.background', [ ['picture-uri', f'\'{wallpaper.as_uri()}\''] ] )
 
-    #3. Configure screensaver wallpaper, i.e. GDM lockscreen
-    lockscreen = BACKGROUNDS/'lockscreen.jpg'
-    run( ['convert', '-resize', '1440', '-quality', '100', '-brightness-contrast',
-          '-10x-15', '-blur', '0x30', wallpaper, lockscreen], stdout=sys.stdout )
+    #3. Configure screensaver wallpaper, i.e. GDM lockscreen, and the GDM
+    #   unlockscreen wallpaper -- both are derived from one decode of sierra
+    derived_lockscreen, derived_lockdialoggroup = derive_wallpapers( sierra )
+    lockscreen = CONFIG.backgrounds/'lockscreen.jpg'
+    sync_file( derived_lockscreen, lockscreen )
+    sync_file( derived_lockdialoggroup, CONFIG.backgrounds/'lockDialogGroup.jpg' ) #read by gdm3css.py
     gsettings_set( 'org.gnome.desktop.screensaver', [ ['picture-uri', f'\'{lockscreen.as_uri()}\''] ] )
 
-    #4. Allow GNOME Wallpaper Picker access to "wallpaper" and "lockscreen"
-    src = INSTALLER_DIR/ Path('resources/gnome-background-properties/revamp-wallpapers.xml')
-    xml = GBACKGROUNDS_PROPERTIES/'revamp-wallpapers.xml'
-    copy2( src, xml )
+    #4. Allow GNOME Wallpaper Picker access to "wallpaper", "lockscreen" and
+    #   the variants of every monitor
+    src = CONFIG.installer_dir/ Path('resources/gnome-background-properties/revamp-wallpapers.xml')
+    xml = CONFIG.gbackgrounds_properties/'revamp-wallpapers.xml'
+    write_wallpaper_properties( src, xml, [ ( f'wallpaper {width}x{height}', path )
+                                            for ( width, height ), path in variants.items() ],
+                                filenames={ 'wallpaper': wallpaper, 'lockscreen': lockscreen } )
+    prune_wallpaper_variants( variants.values() )
+
+    #5. Let the nautilus script "Revamp Wallpaper" use the same format and quality
+    CONFIG.config_dir.mkdir( parents=True, exist_ok=True )
+    atomic_write( CONFIG.config_dir/'wallpaper.json', json.dumps(
+        { 'format': 'webp' if wallpaper.suffix == '.webp' else 'jpeg', 'quality': WALLPAPER_QUALITY } ) )
     print( 'Configuring Desktop Wallpaper and Screensaver... Done.' )
 
 
+def monitor_geometries():
+    '''Function to return the (width, height) of every connected monitor as
+    reported by xrandr, largest first. Returns [] when xrandr is unavailable.'''
+    try:
+        result = run( ['xrandr', '--current'], stdout=PIPE, stderr=DEVNULL,
+                      universal_newlines=True )
+    except FileNotFoundError:
+        return []
+    geometries = { ( int(width), int(height) ) for width, height in re.findall(
+        r' connected (?:primary )?(\d+)x(\d+)\+\d+\+\d+', result.stdout ) }
+    return sorted( geometries, key=lambda size: size[0] * size[1], reverse=True )
+
+
+def derive_wallpapers( src, width=None ):
+    '''Function to derive the blurred lockscreen image and the GDM
+    lockDialogGroup image from wallpaper "src", "width" pixels wide (default
+    is the widest connected monitor).
+
+    Both images come from a single decode of "src" and are cached in
+    CONFIG.cache_dir/wallpapers under the sha256 of "src" and the derivation
+    parameters, so an unchanged wallpaper is not processed again. Pillow is
+    used when it is installed, else ImageMagick's convert. Returns the cached
+    (lockscreen, lockdialoggroup) paths.'''
+    if width is None:
+        geometries = monitor_geometries()
+        width = geometries[0][0] if geometries else WALLPAPER_WIDTH
+    params = dict( LOCKSCREEN_EFFECTS, width=width )
+    key = hashlib.sha256( ( file_sha256( src ) + json.dumps( params, sort_keys=True ) )
+                          .encode() ).hexdigest()
+    cache = CONFIG.cache_dir / 'wallpapers' / key
+    lockscreen = cache / 'lockscreen.jpg'
+    lockdialoggroup = cache / 'lockDialogGroup.jpg'
+    if lockscreen.is_file() and lockdialoggroup.is_file():
+        return lockscreen, lockdialoggroup
+
+    #1. Derive the images in a scratch directory and move it into place
+    cache.parent.mkdir( parents=True, exist_ok=True )
+    tmp = Path( mkdtemp( dir=str(cache.parent), prefix='.tmp-' ) )
+    try:
+        try:
+            _derive_wallpapers_pillow( src, tmp/lockscreen.name, tmp/lockdialoggroup.name, params )
+        except ImportError:
+            _derive_wallpapers_convert( src, tmp/lockscreen.name, tmp/lockdialoggroup.name, params )
+        try:
+            os.rename( str(tmp), str(cache) )
+        except OSError: #a concurrent run has cached them already
+            pass
+    finally:
+        if tmp.exists():
+            rmtree( tmp )
+    return lockscreen, lockdialoggroup
+
+
+def wallpaper_variants( src, geometries=None, fmt=None, quality=None ):
+    '''Function to pre-scale wallpaper "src" for each monitor geometry, so
+    that GNOME Shell does not decode and scale a full-size image at login.
+
+    Arguments:
+     src        - path of the wallpaper.
+     geometries - list of (width, height); default is the connected monitors.
+     fmt        - 'jpeg' or 'webp'; default is WALLPAPER_FORMAT.
+     quality    - encoder quality; default is WALLPAPER_QUALITY.
+
+    A variant just covers its geometry, like the "zoom" option of GNOME, and
+    is kept in CONFIG.wallpaper_variants_dir as "<digest>-<width>x<height>-q<quality>.<ext>",
+    where digest starts the sha256 of "src". Existing variants are reused and
+    "src" is decoded at most once to create the missing ones. A geometry that
+    "src" does not exceed is left out. The digest and the geometries "src"
+    does not exceed are recorded in CONFIG.cache_dir/wallpapers/variants.json
+    under the path, size and mtime of "src", so an unchanged "src" is neither
+    hashed nor decoded again. Returns {(width, height): path}, largest
+    geometry first.'''
+    geometries = monitor_geometries() if geometries is None else geometries
+    fmt = fmt or WALLPAPER_FORMAT
+    quality = quality or WALLPAPER_QUALITY
+    if fmt == 'webp' and not pixbuf_loads( 'webp' ):
+        print( ' gdk-pixbuf has no WebP loader, so GNOME cannot show WebP wallpapers; using JPEG.' )
+        fmt = 'jpeg'
+    ext = 'webp' if fmt == 'webp' else 'jpg'
+    index_path = CONFIG.cache_dir / 'wallpapers' / 'variants.json'
+    try:
+        index = json.loads( index_path.read_text() )
+    except ( FileNotFoundError, ValueError ):
+        index = {}
+    src_stat = Path( src ).stat()
+    stamp = f'{Path( src ).resolve()} {src_stat.st_size} {src_stat.st_mtime_ns}'
+    record = index.get( stamp ) or { 'digest': file_sha256( src )[:16], 'fits': [] }
+    digest = record['digest']
+    variants = { ( width, height ): CONFIG.wallpaper_variants_dir / f'{digest}-{width}x{height}-q{quality}.{ext}'
+                 for width, height in geometries if f'{width}x{height}' not in record['fits'] }
+    missing = { geometry: path for geometry, path in variants.items() if not path.is_file() }
+    if missing:
+        CONFIG.wallpaper_variants_dir.mkdir( parents=True, exist_ok=True )
+        try:
+            made = _scale_wallpaper_pillow( src, missing, fmt, quality )
+        except ( ImportError, OSError, KeyError ) as exc: #no Pillow, or no encoder for fmt
+            if not isinstance( exc, ImportError ):
+                print( f' Pillow cannot write {fmt} wallpapers ({exc!r}); using convert.' )
+            made = _scale_wallpaper_convert( src, missing, fmt, quality )
+        for geometry in missing:
+            if geometry not in made:
+                del variants[ geometry ]
+                record['fits'].append( '{}x{}'.format( *geometry ) )
+    if index.get( stamp ) != record:
+        index[ stamp ] = record
+        index_path.parent.mkdir( parents=True, exist_ok=True )
+        atomic_write( index_path, json.dumps( index, indent=1 ) )
+    return variants
+
+
+def pixbuf_loads( fmt ):
+    '''Function to return whether gdk-pixbuf, which GNOME uses to load
+    wallpapers, has a loader for image format "fmt", e.g. 'webp'.'''
+    try:
+        import gi
+        gi.require_version( 'GdkPixbuf', '2.0' )
+        from gi.repository import GdkPixbuf
+    except ( ImportError, ValueError ):
+        loaders = Path( '/usr/lib' ).glob( f'*/gdk-pixbuf-2.0/*/loaders/*{fmt}*' )
+        return next( loaders, None ) is not None
+    return any( fmt in pixbuf_format.get_name().lower()
+                for pixbuf_format in GdkPixbuf.Pixbuf.get_formats() )
+
+
+def _scale_wallpaper_pillow( src, targets, fmt, quality ):
+    from PIL import Image
+    made = []
+    with Image.open( str(src) ) as image:
+        sizes = {}
+        for ( width, height ), dst in targets.items():
+            scale = max( width / image.width, height / image.height )
+            if scale < 1:
+                sizes[ ( width, height ) ] = ( round( image.width * scale ),
+                                               round( image.height * scale ) )
+        if not sizes:
+            return made
+        image.draft( 'RGB', max( sizes.values() ) ) #let the JPEG decoder downscale
+        image = image.convert( 'RGB' )
+    for geometry, size in sizes.items():
+        dst = targets[ geometry ]
+        tmp = dst.with_name( f'.{dst.name}.{os.getpid()}.tmp' )
+        image.resize( size, Image.LANCZOS ).save( str(tmp), fmt.upper(), quality=quality )
+        atomic_replace( tmp, dst )
+        made.append( geometry )
+    return made
+
+
+def _scale_wallpaper_convert( src, targets, fmt, quality ):
+    cmd = [ 'convert', str(src), '-quality', str(quality) ]
+    tmps = []
+    for ( width, height ), dst in targets.items():
+        tmp = dst.with_name( f'.{dst.name}.{os.getpid()}.tmp' )
+        cmd += [ '(', '+clone', '-resize', f'{width}x{height}^>', '-write', f'{fmt}:{tmp}', '+delete', ')' ]
+        tmps.append( tmp )
+    run( cmd + [ 'null:' ], stdout=sys.stdout, check=True )
+    for tmp, dst in zip( tmps, targets.values() ):
+        atomic_replace( tmp, dst )
+    return list( targets ) #convert cannot tell whether it shrank "src"
+
+
+def write_wallpaper_properties( template, xml, entries, filenames=None ):
+    '''Function to write the gnome-background-properties file "xml": the
+    wallpapers of file "template" followed by "entries", a list of
+    (name, path), so that the GNOME Wallpaper Picker lists them too.
+    "filenames" maps the name of a wallpaper of "template" to the path that
+    replaces its filename, e.g. {'wallpaper': Path('.../wallpaper.webp')}.'''
+    text = template.read_text()
+    for name, path in ( filenames or {} ).items():
+        text = re.sub( rf'(<name>{re.escape( name )}</name>\s*<filename>)[^<]*(</filename>)',
+                       lambda match: match.group(1) + escape( str(path) ) + match.group(2), text, count=1 )
+    wallpapers = ''.join(
+        f' <wallpaper>\n'
+        f'     <name>{escape( name )}</name>\n'
+        f'     <filename>{escape( str(path) )}</filename>\n'
+        f'     <options>zoom</options>\n'
+        f'     <pcolor>#000000</pcolor>\n'
+        f'     <scolor>#000000</scolor>\n'
+        f'     <shade_type>solid</shade_type>\n'
+        f' </wallpaper>\n' for name, path in entries )
+    atomic_write( xml, text.replace( '</wallpapers>', wallpapers + '</wallpapers>' ) )
+
+
+def prune_wallpaper_variants( keep ):
+    '''Function to delete the files in CONFIG.wallpaper_variants_dir that are not in
+    "keep", e.g. variants of a wallpaper that is no longer used. The variants
+    of the nautilus script "Revamp Wallpaper", named "nautilus-*", are kept.'''
+    if not CONFIG.wallpaper_variants_dir.is_dir():
+        return
+    keep = { Path( path ).name for path in keep }
+    for entry in os.scandir( str(CONFIG.wallpaper_variants_dir) ):
+        if entry.name not in keep and not entry.name.startswith( 'nautilus-' ):
+            os.unlink( entry.path )
+
+
+def _derive_wallpapers_pillow( src, lockscreen, lockdialoggroup, params ):
+    from PIL import Image, ImageEnhance, ImageFilter
+    with Image.open( str(src) ) as image:
+        width = min( params['width'], image.width )
+        height = round( image.height * width / image.width )
+        image.draft( 'RGB', ( width, height ) ) #let the JPEG decoder downscale
+        image = image.convert( 'RGB' )
+    image = image.resize( ( width, height ), Image.LANCZOS )
+    image.save( str(lockdialoggroup), 'JPEG', quality=params['quality'] )
+    image = ImageEnhance.Brightness( image ).enhance( params['brightness'] )
+    image = ImageEnhance.Contrast( image ).enhance( params['contrast'] )
+    image = image.filter( ImageFilter.GaussianBlur( params['sigma'] * width / WALLPAPER_WIDTH ) )
+    image.save( str(lockscreen), 'JPEG', quality=params['quality'] )
+
+
+def _derive_wallpapers_convert( src, lockscreen, lockdialoggroup, params ):
+    brightness = round( ( params['brightness'] - 1 ) * 100 )
+    contrast = round( ( params['contrast'] - 1 ) * 100 )
+    sigma = params['sigma'] * params['width'] / WALLPAPER_WIDTH
+    run( ['convert', str(src), '-resize', f'{params["width"]}>', '-quality', str(params['quality']),
+          '-write', str(lockdialoggroup),
+          '-brightness-contrast', f'{brightness}x{contrast}', '-blur', f'0x{sigma:g}',
+          str(lockscreen)], stdout=sys.stdout, check=True )
+
+
 def configure_GDM():
     print( '\nConfiguring GNOME Display Manager (GDM) ...' )
     #1. Install revamp1804.css and its files
-    installer_css = INSTALLER_DIR / Path('resources/gnome-shell_theme/Revamp1804/revamp1804.css')
+    installer_css = CONFIG.installer_dir / Path('resources/gnome-shell_theme/Revamp1804/revamp1804.css')
     print( f'installer_css = {installer_css}' )
-    run( [ 'sudo', 'python3.6', str( INSTALLER_DIR / 'gdm3css.py' ),
+    run( [ 'sudo', 'python3.6', str( CONFIG.installer_dir / 'gdm3css.py' ),
            '--install', str( installer_css ) ] )
     
     print( 'Configuring GNOME Display Manager (GDM) ... Done' )
@@ -746,17 +2878,18 @@ def reset_GDM():
     print( '\nResetting GNOME Display Manager (GDM) ...' )
     #1. Remove revamp1804.css and its files and put back ubuntu.css
     css = Path('/usr/share/gnome-shell/theme/Revamp1804/revamp1804.css')
-    run( [ 'sudo', 'python3.6', str( INSTALLER_DIR / 'gdm3css.py' ),
+    run( [ 'sudo', 'python3.6', str( CONFIG.installer_dir / 'gdm3css.py' ),
            '--remove', str( css ) ] )
     print( 'Resetting GNOME Display Manager (GDM) ... Done' )
 
     
 def reset_Desktop_and_Lockscreen_Wallpaper():
     print( '\n  Resetting Desktop Wallpaper and Screensaver...' )
+    makedirs( CONFIG.backgrounds, CONFIG.gbackgrounds_properties )
     #1. Reset desktop wallpaper
     warty = Path( '/usr/share/backgrounds/warty-final-ubuntu.png' )
-    warty_src = INSTALLER_DIR /  Path( 'resources/backgrounds/warty-final-ubuntu.png' )
-    warty_dst = BACKGROUNDS / 'warty-final-ubuntu.png'
+    warty_src = CONFIG.installer_dir /  Path( 'resources/backgrounds/warty-final-ubuntu.png' )
+    warty_dst = CONFIG.backgrounds / 'warty-final-ubuntu.png'
     if not warty.exists():
         copy2( warty_src, warty_dst )
         wallpaper = warty_dst
@@ -767,8 +2900,8 @@ def reset_Desktop_and_Lockscreen_Wallpaper():
 
     #2. Reset screensaver wallpaper, i.e. GDM lockscreen
     wartygrey = Path( '/usr/share/backgrounds/Beaver_Wallpaper_Grey_4096x2304.png' )
-    wartygrey_src = INSTALLER_DIR /  Path( 'resources/backgrounds/Beaver_Wallpaper_Grey_4096x2304.png' )
-    wartygrey_dst = BACKGROUNDS / 'Beaver_Wallpaper_Grey_4096x2304.png'
+    wartygrey_src = CONFIG.installer_dir /  Path( 'resources/backgrounds/Beaver_Wallpaper_Grey_4096x2304.png' )
+    wartygrey_dst = CONFIG.backgrounds / 'Beaver_Wallpaper_Grey_4096x2304.png'
     if not wartygrey.exists():
         copy2( wartygrey_src, wartygrey_dst )
         lockscreen = wartygrey_dst
@@ -777,16 +2910,19 @@ def reset_Desktop_and_Lockscreen_Wallpaper():
     gsettings_set( 'org.gnome.desktop.screensaver', [ ['picture-uri', f'\'{lockscreen.as_uri()}\''] ] )
 
     #3. Allow GNOME Wallpaper Picker access to "wallpaper" and "lockscreen"
-    src = INSTALLER_DIR/ Path('resources/gnome-background-properties/ubuntu-wallpapers.xml')
-    xml = GBACKGROUNDS_PROPERTIES/'ubuntu-wallpapers.xml'
-    copy2( src, xml )
-
-    #4. Remove revamp files & folders
-    rmtree( BACKGROUNDS / 'Sierra-wallpapers' )
-    lockscreen = BACKGROUNDS / 'lockscreen.jpg'
-    wallpaper = BACKGROUNDS / 'wallpaper.jpg'
-    lockscreen.unlink()
-    wallpaper.unlink()
+    src = CONFIG.installer_dir/ Path('resources/gnome-background-properties/ubuntu-wallpapers.xml')
+    xml = CONFIG.gbackgrounds_properties/'ubuntu-wallpapers.xml'
+    write_wallpaper_properties( src, xml, [] )
+
+    #4. Remove revamp files & folders, incl. the pre-scaled wallpaper variants
+    rmtree( CONFIG.backgrounds / 'Sierra-wallpapers' )
+    if CONFIG.wallpaper_variants_dir.is_dir():
+        rmtree( CONFIG.wallpaper_variants_dir )
+    for name in ( 'lockscreen.jpg', 'lockscreen.webp', 'wallpaper.jpg', 'wallpaper.webp', 'lockDialogGroup.jpg' ):
+        if ( CONFIG.backgrounds / name ).exists():
+            ( CONFIG.backgrounds / name ).unlink()
+    if ( CONFIG.config_dir / 'wallpaper.json' ).exists():
+        ( CONFIG.config_dir / 'wallpaper.json' ).unlink()
     print( '  Resetting Desktop Wallpaper and Screensaver... Done.' )
 
 
@@ -801,7 +2937,7 @@ def reset_Applications():
 
 def remove_nautilus_script_Revamp_Wallpaper():
     print( '\n  Removing nautilus script "Revamp Wallpaper" ...' )
-    dst = HOME / Path('.local/share/nautilus/scripts/Revamp Wallpaper')
+    dst = CONFIG.home / Path('.local/share/nautilus/scripts/Revamp Wallpaper')
     dst.unlink()
     print( '  Removing nautilus script "Revamp Wallpaper" ... Done.' )
 
@@ -818,26 +2954,13 @@ def reset_nautilus():
 
 def reset_libreoffice():
     print( '\n  Resetting libreoffice ...' )
-    def newphrasesymbolstyle( style ):
-        return f'"SymbolStyle" oor:op="fuse"><value>{style}</value></prop></item>'
-
-    lbxcu = HOME/'.config'/'libreoffice'/'4'/'user'/'registrymodifications.xcu'
+    lbxcu = CONFIG.home/'.config'/'libreoffice'/'4'/'user'/'registrymodifications.xcu'
     symbolstyles = [ 'sifr', 'sifr_dark', 'tango', 'breeze', 'galaxy', 'breeze_dark' ]
     if lbxcu.exists():
-        with open( lbxcu, 'r' ) as file:
-            filedata = file.read()
-        for style in symbolstyles:
-            print( f'style = {style}, {type(style)} ' )
-            old = newphrasesymbolstyle(style)
-            print( f'old = {old} ' )
-            if filedata.find( old ):
-                print( 'Found ', old )
-                filedata = filedata.replace( old, newphrasesymbolstyle('auto') )
-                break
-            else:
-                print('  Did not replace style to "auto".')
-        with open( lbxcu, 'w' ) as file:
-            file.write( filedata )
+        if rewrite_symbolstyle( lbxcu, symbolstyles, 'auto' ):
+            print( '  Replaced icon style with "auto".' )
+        else:
+            print( '  Did not replace style to "auto".' )
         print( '  Resetting libreoffice ... Done.' )
     else:
         print( '  Resetting libreoffice ... Not Done.' )
@@ -1012,7 +3135,7 @@ def remove_themes_fonts_gsextensions():
     #2. Remove Fonts
     local_fonts = [ 'macfonts', 'SanFranciscoFont-master', '.uuid' ]
     for lf in local_fonts:
-        font = FONTS / lf
+        font = CONFIG.fonts / lf
         if font.is_dir():
             rmtree( font )
             print( f'   - removed {font}' )
@@ -1027,7 +3150,7 @@ def remove_themes_fonts_gsextensions():
                     'Cupertino-iCons-master',
                     'MacOSMOD-master' ]
     for li in local_icons:
-        icon = ICONS / li
+        icon = CONFIG.icons / li
         if icon.is_dir():
             rmtree( icon )
             print( f'   - removed {icon}' )
@@ -1036,6 +3159,7 @@ def remove_themes_fonts_gsextensions():
     #4. Remove gnome-shell extension schemas
     local_gschemas = [
         'gschemas.compiled',
+        GLIB2_SCHEMAS_DIGEST,
         'org.gnome.shell.extensions.arc-menu.gschema.xml',
         'org.gnome.shell.extensions.blyr.gschema.xml',
         'org.gnome.shell.extensions.dynamic-panel-transparency.gschema.xml',
@@ -1045,7 +3169,7 @@ def remove_themes_fonts_gsextensions():
         'org.gnome.shell.extensions.suspend-button.gschema.xml',
         ]
     for i in local_gschemas:
-        gschema = GLIB2_SCHEMAS / i
+        gschema = CONFIG.glib2_schemas / i
         if gschema.is_file():
             gschema.unlink()
             print( f'   - removed {gschema}' )
@@ -1065,7 +3189,7 @@ def remove_themes_fonts_gsextensions():
         'workspace-indicator@gnome-shell-extensions.gcampax.github.com',
         ]
     for i in local_gsextensions:
-        ext = GSEXTENSIONS / i
+        ext = CONFIG.gsextensions / i
         if ext.is_dir():
             rmtree( ext )
             print( f'   - removed {ext}' )
@@ -1076,52 +3200,286 @@ def remove_themes_fonts_gsextensions():
     
 def reset_apt_repository():
     '''Function to remove 'ppa:dyatlov-igor/sierra-theme' from apt-repository.'''
-    cmd = ['sudo', 'add-apt-repository', '-y', '--remove', PPA[0] ]
-    runN( cmd )
+    for ppa in PPA:
+        if APT_SOURCES.has( ppa ):
+            cmd = ['sudo', 'add-apt-repository', '-y', '--no-update', '--remove', ppa ]
+            runN( cmd )
     print( f'\napt-repository is up to date.' )
     
 
-def restart_gnome_shell():
+def restart_gnome_shell( name=None, timeout=None ):
+    '''Function to restart GNOME Shell and wait until it is back, i.e. until
+    bus name "name" (default GNOME_SHELL_BUS_NAME) has a new owner on the
+    session bus. GNOME Shell is asked to restart itself through its Eval
+    method; xdotool typing Alt+F2 r Return is the fallback. Returns True once
+    the shell is back, False if it cannot be restarted or does not come back
+    within "timeout" seconds (default GNOME_SHELL_RESTART_TIMEOUT).'''
     print( '\nRestarting GNOME shell ...' )
-    cmd = 'xdotool key "Alt+F2+r" && sleep 0.5 && xdotool key "Return"'
-    time.sleep( 0.5 )
-    run( cmd, shell=True, stdout=sys.stdout )
-    print( 'Restarting GNOME shell ... Done.' )
+    name = name or GNOME_SHELL_BUS_NAME
+    timeout = GNOME_SHELL_RESTART_TIMEOUT if timeout is None else timeout
+    if os.environ.get( 'XDG_SESSION_TYPE' ) == 'wayland':
+        print( 'Restarting GNOME shell ... Not Done: a Wayland session must log out and in again.' )
+        return False
+    old_owner = dbus_name_owner( name )
+    if old_owner is None:
+        print( f'Restarting GNOME shell ... Not Done: {name} is not on the session bus.' )
+        return False
+
+    #1. Restart; the restart is deferred to an idle callback so that Eval replies first
+    start = time.monotonic()
+    js = 'imports.mainloop.idle_add( () => { Meta.restart( "Restarting\u2026" ); } ); true'
+    if not gnome_shell_eval( js, name ):
+        run( 'xdotool key "Alt+F2+r" && sleep 0.5 && xdotool key "Return"', shell=True,
+             stdout=sys.stdout )
+
+    #2. Wait for GNOME Shell to own its bus name again
+    if wait_for_dbus_name( name, old_owner, timeout ) is None:
+        print( f'Restarting GNOME shell ... Failed: {name} did not come back within {timeout}s.' )
+        return False
+    print( f'Restarting GNOME shell ... Done in {time.monotonic() - start:.1f}s.' )
+    return True
+
+
+def gnome_shell_eval( js, name=None ):
+    '''Function to evaluate javascript "js" in GNOME Shell, the owner of bus
+    name "name" (default GNOME_SHELL_BUS_NAME). Uses Gio when PyGObject is
+    installed, else gdbus. Returns True if GNOME Shell reports success.'''
+    name = name or GNOME_SHELL_BUS_NAME
+    try:
+        import gi
+        gi.require_version( 'Gio', '2.0' )
+        from gi.repository import Gio, GLib
+    except ( ImportError, ValueError ):
+        result = run( [ 'gdbus', 'call', '--session', '--dest', name,
+                        '--object-path', '/org/gnome/Shell',
+                        '--method', 'org.gnome.Shell.Eval', js ],
+                      stdout=PIPE, stderr=DEVNULL, universal_newlines=True )
+        return result.returncode == 0 and result.stdout.startswith( '(true,' )
+    try:
+        bus = Gio.bus_get_sync( Gio.BusType.SESSION, None )
+        success, _ = bus.call_sync( name, '/org/gnome/Shell', 'org.gnome.Shell', 'Eval',
+                                    GLib.Variant( '(s)', ( js, ) ), GLib.VariantType( '(bs)' ),
+                                    Gio.DBusCallFlags.NONE, 5000, None ).unpack()
+    except GLib.Error:
+        return False
+    return success
+
+
+def dbus_name_owner( name ):
+    '''Function to return the unique name of the owner of bus name "name" on
+    the session bus, or None if it has no owner. Uses Gio when PyGObject is
+    installed, else gdbus.'''
+    try:
+        import gi
+        gi.require_version( 'Gio', '2.0' )
+        from gi.repository import Gio, GLib
+    except ( ImportError, ValueError ):
+        try:
+            result = run( [ 'gdbus', 'call', '--session', '--dest', 'org.freedesktop.DBus',
+                            '--object-path', '/org/freedesktop/DBus',
+                            '--method', 'org.freedesktop.DBus.GetNameOwner', name ],
+                          stdout=PIPE, stderr=DEVNULL, universal_newlines=True )
+        except FileNotFoundError:
+            return None
+        match = re.match( r"\('([^']+)',\)", result.stdout )
+        return match.group(1) if result.returncode == 0 and match else None
+    try:
+        bus = Gio.bus_get_sync( Gio.BusType.SESSION, None )
+        owner, = bus.call_sync( 'org.freedesktop.DBus', '/org/freedesktop/DBus',
+                                'org.freedesktop.DBus', 'GetNameOwner',
+                                GLib.Variant( '(s)', ( name, ) ), GLib.VariantType( '(s)' ),
+                                Gio.DBusCallFlags.NONE, 1000, None ).unpack()
+    except GLib.Error: #org.freedesktop.DBus.Error.NameHasNoOwner, or no session bus
+        return None
+    return owner
+
+
+def wait_for_dbus_name( name, old_owner=None, timeout=None, interval=0.1 ):
+    '''Function to poll the session bus every "interval" seconds until bus name
+    "name" is owned by a connection other than "old_owner". Returns the new
+    owner, or None when "timeout" seconds (default GNOME_SHELL_RESTART_TIMEOUT)
+    pass first.'''
+    timeout = GNOME_SHELL_RESTART_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    while True:
+        owner = dbus_name_owner( name )
+        if owner is not None and owner != old_owner:
+            return owner
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep( interval )
+
+
+def sudo_validate():
+    '''Ask for the sudo password once, before phases that use sudo run concurrently.'''
+    run( [ 'sudo', '-v' ] )
+
+
+def run_phases( phases, jobs=None, journal=None ):
+    '''Run "phases", a list of Phase objects, on up to "jobs" threads. A phase
+    starts once all its prerequisites have completed and none of its locks is
+    held by a running phase; ready phases start in the order they are listed.
+    Phases that "journal", a Journal object, recorded as completed are not
+    run again, and completed phases are recorded in it. The gsettings that
+    a phase holding the 'dconf' lock queued in an open gsettings_batch() are
+    applied before it counts as completed, so it is never recorded with its
+    settings unwritten. Only one such phase runs at a time, so the queue
+    then holds its own settings only; phases without the lock must not call
+    gsettings_set().
+    After the first failure no new phase is started and, once the running
+    phases have finished, the failure is raised. A timing report is printed
+    in any case.'''
+    import concurrent.futures as cf
+    jobs = jobs or JOBS
+    names = { phase.name for phase in phases }
+    for phase in phases:
+        unknown = phase.requires - names
+        if unknown:
+            raise ValueError( f'{phase.name} requires unknown phase(s) {sorted(unknown)}.' )
+
+    def timed( phase ):
+        start = time.time()
+        with PROFILER.phase( phase.name ):
+            phase.func()
+            if 'dconf' in phase.locks:
+                gsettings_flush()
+        return start, time.time()
+
+    pending = list( phases )
+    running = {}  # future -> phase
+    done = set()
+    if journal is not None:
+        for phase in phases:
+            if phase.journal and journal.phase_done( phase.name ):
+                print( f'\nSkipped {phase.name}: it was completed by an earlier run.' )
+                pending.remove( phase )
+                done.add( phase.name )
+    held = set()
+    timings = {}  # phase name -> (start, end)
+    failure = None
+    t0 = time.time()
+    with cf.ThreadPoolExecutor( max_workers=jobs ) as executor:
+        while pending or running:
+            if failure is None:
+                for phase in list( pending ):
+                    if len( running ) >= jobs:
+                        break
+                    if phase.requires <= done and not phase.locks & held:
+                        pending.remove( phase )
+                        held |= phase.locks
+                        running[ executor.submit( timed, phase ) ] = phase
+            if not running:
+                if failure is None:
+                    failure = RuntimeError( f'Phases {[p.name for p in pending]} can never start.' )
+                break
+            finished, _ = cf.wait( running, return_when=cf.FIRST_COMPLETED )
+            for future in finished:
+                phase = running.pop( future )
+                held -= phase.locks
+                try:
+                    timings[ phase.name ] = future.result()
+                except BaseException as exc:
+                    print( f'\nPhase {phase.name} failed: {exc!r}' )
+                    if failure is None:
+                        failure = exc
+                else:
+                    done.add( phase.name )
+                    if journal is not None and phase.journal:
+                        journal.mark_phase( phase.name )
+    show_phase_timings( phases, timings, t0, time.time() )
+    if failure is not None:
+        raise failure
+
+
+def show_phase_timings( phases, timings, t0, t1 ):
+    '''Print when each completed phase ran and the critical path, i.e. the
+    chain of prerequisites with the longest total duration.'''
+    print( f'\nPhase timings (wall-clock {t1-t0:.2f} sec):' )
+    print( f' {"start":>8} {"end":>8} {"sec":>8}  phase' )
+    for name, ( start, end ) in sorted( timings.items(), key=lambda t: t[1] ):
+        print( f' {start-t0:8.2f} {end-t0:8.2f} {end-start:8.2f}  {name}' )
+
+    requires = { phase.name: phase.requires for phase in phases }
+    path = {}  # phase name -> (length, chain of phase names)
+
+    def longest( name ):
+        if name not in path:
+            start, end = timings[name]
+            before = [ longest(r) for r in requires[name] if r in timings ]
+            length, chain = max( before, default=(0, []) )
+            path[name] = ( length + end - start, chain + [name] )
+        return path[name]
+
+    if timings:
+        length, chain = max( longest(name) for name in timings )
+        print( f'Critical path ({length:.2f} sec): {" -> ".join(chain)}' )
 
 
 def install():
     show_intro()
-    apt_update()
-    update_apt_repository()
-    apt_dist_upgrade()
-    install_apt_pkgs()
-    #Install Chromium Broswer extension: GNOME Shell integration
-    # Download themes, fonts and gnome-shell extensions and install them
-    install_themes_fonts_gsextensions()
-    configure_GNOME_Shell_extensions()
-    configure_Desktop()
-    configure_Window_Manager_Preferences()
-    configure_Applications()
-    configure_Desktop_and_Lockscreen_Wallpaper()
-    configure_GDM()
-    restart_gnome_shell()
+    JOURNAL.begin( 'install' )
+    sudo_validate() #before the prefetch prints, so its output cannot interleave with the password prompt
+    if JOURNAL.phase_done( 'prefetch_downloads' ):
+        prefetch = None
+    else:
+        prefetch = start_prefetch()
+    installed = [ 'install_apt_pkgs', 'install_themes_fonts_gsextensions' ] #the themes, fonts and libreoffice-style-sifr are on disk
+    phases = [
+        Phase( prefetch.result if prefetch else prefetch_downloads, name='prefetch_downloads' ),
+        Phase( apt_update, locks=['apt'] ),
+        Phase( update_apt_repository, requires=['apt_update'], locks=['apt'] ),
+        Phase( install_apt_pkgs, requires=['update_apt_repository'], locks=['apt'] ),
+        #Install Chromium Broswer extension: GNOME Shell integration
+        # Download themes, fonts and gnome-shell extensions and install them
+        Phase( install_themes_fonts_gsextensions, requires=['prefetch_downloads'],
+               journal=False ), #its archives are journaled one by one
+        Phase( enable_sudo_gsextensions,
+               requires=['install_apt_pkgs', 'install_themes_fonts_gsextensions'] ),
+        # The 'dconf' lock runs one gsettings-writing phase at a time, so the
+        # queued gsettings that run_phases() applies when a phase ends are
+        # that phase's own and its journal record is exact.
+        Phase( configure_GNOME_Shell_extensions,
+               requires=['enable_sudo_gsextensions'], locks=['dconf'] ),
+        Phase( configure_Desktop, requires=installed, locks=['dconf'] ),
+        Phase( configure_Window_Manager_Preferences, requires=installed, locks=['dconf'] ),
+        Phase( configure_Applications, requires=installed, locks=['dconf'] ),
+        Phase( configure_Desktop_and_Lockscreen_Wallpaper, requires=installed, locks=['dconf'] ),
+        Phase( configure_GDM, requires=['configure_Desktop_and_Lockscreen_Wallpaper'] ),
+        ]
+    with gsettings_batch():
+        run_phases( phases, journal=JOURNAL )
+    with PROFILER.phase( 'restart_gnome_shell' ):
+        restart_gnome_shell()
+    JOURNAL.clear()
     
 
 def remove():
     show_intro()
     show_remove_statement()
-    reset_GDM()
-    reset_Desktop_and_Lockscreen_Wallpaper()
-    reset_Applications()
-    reset_Window_Manager_Preferences()
-    reset_Desktop()
-    reset_GNOME_Shell_extensions()
-    remove_themes_fonts_gsextensions()
-    restart_gnome_shell()
-    remove_apt_pkgs()
-    reset_apt_repository()
-    apt_update()
-    apt_dist_upgrade()
+    JOURNAL.begin( 'remove' )
+    sudo_validate()
+    # Every setting is reset, with the schemas of the packages still
+    # installed, and GNOME Shell restarted before apt removes anything.
+    resets = [ 'reset_GDM', 'reset_Desktop_and_Lockscreen_Wallpaper', 'reset_Applications',
+               'reset_Window_Manager_Preferences', 'reset_Desktop', 'reset_GNOME_Shell_extensions',
+               'remove_themes_fonts_gsextensions' ]
+    phases = [
+        Phase( reset_GDM ),
+        Phase( reset_Desktop_and_Lockscreen_Wallpaper, locks=['dconf'] ),
+        Phase( reset_Applications, locks=['dconf'] ),
+        Phase( reset_Window_Manager_Preferences, locks=['dconf'] ),
+        Phase( reset_Desktop, locks=['dconf'] ),
+        Phase( reset_GNOME_Shell_extensions, locks=['dconf'] ),
+        Phase( remove_themes_fonts_gsextensions, locks=['dconf'] ),
+        Phase( restart_gnome_shell, requires=resets, journal=False ),
+        Phase( remove_apt_pkgs, requires=resets + ['restart_gnome_shell'], locks=['apt'] ),
+        Phase( reset_apt_repository, requires=['remove_apt_pkgs'], locks=['apt'] ),
+        Phase( apt_update, requires=['reset_apt_repository'], locks=['apt'] ),
+        Phase( apt_dist_upgrade, requires=['apt_update'], locks=['apt'] ),
+        ]
+    with gsettings_batch():
+        run_phases( phases, journal=JOURNAL )
+    JOURNAL.clear()
     
 
 def install_chromium_extensions( url ):
@@ -1130,29 +3488,64 @@ def install_chromium_extensions( url ):
 
 
 def main():
+    global APT_TTL, DOWNLOAD_ENGINE, JOBS, MEMORY_CEILING, WALLPAPER_FORMAT, WALLPAPER_QUALITY
     #1. Setup the argument parser 
     parser = argparse.ArgumentParser()
 
     #2. Define arguement
     parser.add_argument( '--install', action='store_true', help='toggles the installation of Revamp 18.04.' )
     parser.add_argument( '--remove', action='store_true', help='toggles the removal of Revamp 18.04.' )
+    parser.add_argument( '--prefetch', action='store_true', help='only download and verify themes, fonts and extensions into the download cache.' )
+    parser.add_argument( '--resume', action='store_true', help='skip the phases and archives that an interrupted --install or --remove completed.' )
+    parser.add_argument( '--offline', action='store_true', help='install themes, fonts and extensions from the download cache only.' )
+    parser.add_argument( '--cache-size', type=int, default=1024, metavar='MB', help='size limit of the download cache (default: 1024).' )
+    parser.add_argument( '--apt-ttl', type=int, default=APT_TTL, metavar='SEC', help=f'skip apt-get update when the package lists are younger than this; 0 always updates (default: {APT_TTL}).' )
+    parser.add_argument( '--jobs', type=int, default=JOBS, metavar='N', help=f'number of phases that may run at the same time; 1 runs them in sequence (default: {JOBS}).' )
+    parser.add_argument( '--memory-ceiling', type=int, default=8, metavar='MB', help='RAM a download may use before it is spooled to disk (default: 8).' )
+    parser.add_argument( '--engine', choices=['threads', 'asyncio'], default=DOWNLOAD_ENGINE, help=f'download themes, fonts and extensions with a pool of threads, or with asyncio showing a live progress line (default: {DOWNLOAD_ENGINE}).' )
+    parser.add_argument( '--profile', nargs='?', const='revamp1804-profile.json', metavar='FILE', help='measure the time, CPU, child processes and I/O of each phase; print a table and write JSON to FILE, or stdout for "-" (default: revamp1804-profile.json).' )
+    parser.add_argument( '--wallpaper-format', choices=['jpeg', 'webp'], default=WALLPAPER_FORMAT, help=f'format of the wallpapers pre-scaled for each monitor; webp needs a gdk-pixbuf WebP loader, else jpeg is used (default: {WALLPAPER_FORMAT}).' )
+    parser.add_argument( '--wallpaper-quality', type=int, default=WALLPAPER_QUALITY, metavar='Q', help=f'encoder quality, 1-100, of the pre-scaled wallpapers (default: {WALLPAPER_QUALITY}).' )
     
     #3. Get the arguements
     args = parser.parse_args()
+    if os.getuid() == 0:
+        sys.exit( print( f'\nQuit: Don\'t run this script with \'sudo\' privilege.\n'
+                         '      Re-run this script as normal user.' ) )
+    print( f'INSTALLER_DIR = {CONFIG.installer_dir}')
+    CACHE.offline = args.offline
+    JOURNAL.resume = args.resume
+    CACHE.max_bytes = args.cache_size * 1024**2
+    MEMORY_CEILING = args.memory_ceiling * 1024**2
+    JOBS = max( 1, args.jobs )
+    APT_TTL = args.apt_ttl
+    WALLPAPER_FORMAT = args.wallpaper_format
+    WALLPAPER_QUALITY = min( 100, max( 1, args.wallpaper_quality ) )
+    DOWNLOAD_ENGINE = args.engine
+    PROFILER.enabled = args.profile is not None
     #print( f'args.install = {args.install}' )#for debugging
     #print( f'args.remove  = {args.remove}' ) #for debugging
 
     #4. Set up the permissible operations from cmdline.
-    if args.install:
-        #print('INSTALL')
-        #print( f'type(args.install) = {type(args.install)}' )
-        install()
-    elif args.remove:
-        #print('REMOVED')
-        remove()
-    else:
-        parser.print_help()
-        print( '\nPlease use command syntax.' )
+    try:
+        if args.prefetch:
+            with PROFILER.phase( 'prefetch_downloads' ):
+                prefetch_downloads()
+        elif args.install:
+            #print('INSTALL')
+            #print( f'type(args.install) = {type(args.install)}' )
+            install()
+        elif args.remove:
+            #print('REMOVED')
+            remove()
+        else:
+            parser.print_help()
+            print( '\nPlease use command syntax.' )
+    finally:
+        if PROFILER.enabled:
+            report = PROFILER.report()
+            PROFILER.show( report )
+            PROFILER.dump( args.profile, report )
 
     
 if __name__ == "__main__":
@@ -0,0 +1,62 @@
+'''
+Fixtures shared by the tests of revamp1804.py and gdm3css.py.
+'''
+import http.server
+import socketserver
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert( 0, str( Path( __file__ ).resolve().parent.parent ) )
+
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    '''Base request handler of the stand-in servers. Every request is
+    recorded in the "requests" list of the server, as ( path, headers ).'''
+    protocol_version = 'HTTP/1.1'
+
+    def log_message( self, *args ):
+        pass
+
+    def record( self ):
+        self.server.requests.append( ( self.path, self.headers ) )
+        return len( self.server.requests )
+
+    def send_body( self, status, body, headers=() ):
+        self.send_response( status )
+        for name, value in headers:
+            self.send_header( name, value )
+        self.send_header( 'Content-Length', str( len( body ) ) )
+        self.end_headers()
+        self.wfile.write( body )
+
+
+@pytest.fixture
+def serve( monkeypatch ):
+    '''Return a function that starts a stand-in HTTP server on localhost with
+    a Handler subclass and returns ( base url, server ). The servers are
+    shut down after the test; the download retries do not wait.'''
+    import revamp1804
+    for name in ( 'http_proxy', 'HTTP_PROXY', 'all_proxy', 'ALL_PROXY' ):
+        monkeypatch.delenv( name, raising=False )
+    monkeypatch.setattr( revamp1804, 'DOWNLOAD_BACKOFF', 0.01 )
+    monkeypatch.setattr( revamp1804, 'HTTP', revamp1804.HTTPPool() )
+    servers = []
+
+    def start( handler ):
+        server = _Server( ( '127.0.0.1', 0 ), handler )
+        server.requests = []
+        threading.Thread( target=server.serve_forever, daemon=True ).start()
+        servers.append( server )
+        return 'http://127.0.0.1:{}'.format( server.server_port ), server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
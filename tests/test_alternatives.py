@@ -0,0 +1,103 @@
+'''
+Tests of gdm3css.Alternatives against a fake dpkg alternatives database,
+given with its "admindir" and "altdir" overrides.
+'''
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+from gdm3css import Alternatives
+
+LINK = '/usr/share/gnome-shell/theme/gdm3.css'
+
+
+@pytest.fixture
+def dirs( tmp_path ):
+    '''Return ( admindir, altdir ) of a gdm3.css group with two
+    alternatives, each with a slave, in manual mode on the lower one.'''
+    admindir = tmp_path / 'admin'
+    altdir = tmp_path / 'alternatives'
+    admindir.mkdir()
+    altdir.mkdir()
+    ( admindir / 'gdm3.css' ).write_text( '\n'.join( [
+        'manual', LINK,
+        'gdm3-background', '/usr/share/gnome-shell/theme/background.png',
+        '',
+        '/usr/share/gnome-shell/theme/ubuntu.css', '10', '/usr/share/a.png',
+        '/usr/share/gnome-shell/theme/mytheme/mytheme.css', '50', '/usr/share/b.png',
+        '', '' ] ) )
+    os.symlink( '/usr/share/gnome-shell/theme/ubuntu.css', str( altdir / 'gdm3.css' ) )
+    return admindir, altdir
+
+
+def test_parses_admin_file_and_symlink( dirs ):
+    alternatives = Alternatives( 'gdm3.css', *dirs )
+    assert alternatives.link == Path( LINK )
+    assert alternatives.status == 'manual'
+    assert alternatives.value == Path( '/usr/share/gnome-shell/theme/ubuntu.css' )
+    assert alternatives.alternatives == {
+        Path( '/usr/share/gnome-shell/theme/ubuntu.css' ): 10,
+        Path( '/usr/share/gnome-shell/theme/mytheme/mytheme.css' ): 50 }
+    assert alternatives.best == Path( '/usr/share/gnome-shell/theme/mytheme/mytheme.css' )
+    assert alternatives.max == 50
+    assert alternatives.has( '/usr/share/gnome-shell/theme/ubuntu.css' )
+    assert not alternatives.has( '/usr/share/gnome-shell/theme/other.css' )
+
+
+def test_query_matches_update_alternatives_format( dirs ):
+    assert Alternatives( 'gdm3.css', *dirs ).query == [
+        'Name: gdm3.css',
+        f'Link: {LINK}',
+        'Status: manual',
+        'Best: /usr/share/gnome-shell/theme/mytheme/mytheme.css',
+        'Value: /usr/share/gnome-shell/theme/ubuntu.css',
+        '',
+        'Alternative: /usr/share/gnome-shell/theme/ubuntu.css',
+        'Priority: 10',
+        '',
+        'Alternative: /usr/share/gnome-shell/theme/mytheme/mytheme.css',
+        'Priority: 50' ]
+
+
+def test_missing_group( tmp_path ):
+    alternatives = Alternatives( 'gdm3.css', tmp_path, tmp_path )
+    assert alternatives.query == []
+    assert alternatives.status is None and alternatives.value is None
+    assert alternatives.best is None and alternatives.max == 0
+
+
+def test_reloads_when_admin_file_changes( dirs ):
+    admindir, altdir = dirs
+    alternatives = Alternatives( 'gdm3.css', admindir, altdir )
+    assert alternatives.status == 'manual'
+    ( admindir / 'gdm3.css' ).write_text( '\n'.join( [
+        'auto', LINK, '', '/usr/share/gnome-shell/theme/ubuntu.css', '10', '', '' ] ) )
+    assert alternatives.status == 'auto'
+    assert alternatives.max == 10
+
+
+@pytest.mark.skipif( shutil.which( 'update-alternatives' ) is None,
+                     reason='update-alternatives is not installed' )
+def test_mutations_run_update_alternatives_in_the_overridden_dirs( tmp_path ):
+    admindir = tmp_path / 'admin'
+    altdir = tmp_path / 'alternatives'
+    admindir.mkdir()
+    altdir.mkdir()
+    link = tmp_path / 'gdm3.css'
+    low, high = tmp_path / 'low.css', tmp_path / 'high.css'
+    low.touch()
+    high.touch()
+    alternatives = Alternatives( 'gdm3.css', admindir, altdir )
+    alternatives.install( link, low, 10 )
+    alternatives.install( link, high, 20 )
+    assert alternatives.status == 'auto' and alternatives.value == high
+    alternatives.set( low )
+    assert alternatives.status == 'manual' and alternatives.value == low
+    #A fresh model reads what update-alternatives wrote.
+    fresh = Alternatives( 'gdm3.css', admindir, altdir )
+    assert fresh.query == alternatives.query
+    alternatives.remove( low )
+    assert alternatives.status == 'auto' and alternatives.value == high
+    assert Alternatives( 'gdm3.css', admindir, altdir ).value == high
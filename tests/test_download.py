@@ -0,0 +1,119 @@
+'''
+Tests of download(): retries, ranged resumes and its typed errors, against
+stand-in servers on localhost.
+'''
+import re
+import socket
+
+import pytest
+
+import revamp1804
+from conftest import Handler
+from revamp1804 import DownloadError, HTTPStatusError, IncompleteDownloadError, download
+
+BODY = bytes( range( 256 ) ) * 512     #128 KiB, two CHUNK_SIZE reads
+
+
+class Dropping(Handler):
+    '''Drop the connection of the first request half way through BODY, then
+    honour Range when If-Range matches the ETag, unless "ranges" is False.'''
+    ranges = True
+
+    def do_GET( self ):
+        n = self.record()
+        start = 0
+        match = re.match( r'bytes=(\d+)-', self.headers.get( 'Range', '' ) )
+        if self.ranges and match and self.headers.get( 'If-Range' ) == '"v1"':
+            start = int( match.group(1) )
+            self.send_response( 206 )
+            self.send_header( 'Content-Range', f'bytes {start}-{len( BODY ) - 1}/{len( BODY )}' )
+        else:
+            self.send_response( 200 )
+        self.send_header( 'ETag', '"v1"' )
+        self.send_header( 'Content-Length', str( len( BODY ) - start ) )
+        self.end_headers()
+        if n == 1:
+            self.wfile.write( BODY[ : len( BODY ) // 2 ] )
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown( socket.SHUT_RDWR )
+            return
+        self.wfile.write( BODY[ start: ] )
+
+
+class NotRanging(Dropping):
+    ranges = False
+
+
+class Short(Handler):
+    '''Always send fewer bytes than the Content-Length.'''
+    def do_GET( self ):
+        self.record()
+        self.send_response( 200 )
+        self.send_header( 'Content-Length', str( len( BODY ) ) )
+        self.end_headers()
+        self.wfile.write( BODY[:1000] )
+        self.close_connection = True
+
+
+class Missing(Handler):
+    def do_GET( self ):
+        self.record()
+        self.send_body( 404, b'not found' )
+
+
+class Unavailable(Handler):
+    '''Answer 503 with Retry-After to the first request.'''
+    def do_GET( self ):
+        if self.record() == 1:
+            self.send_body( 503, b'', [ ( 'Retry-After', '0' ) ] )
+        else:
+            self.send_body( 200, BODY )
+
+
+def content( spool ):
+    body = spool.close()
+    return body.getvalue() if hasattr( body, 'getvalue' ) else body.read_bytes()
+
+
+def test_interrupted_body_is_resumed_with_range( serve, tmp_path ):
+    base, server = serve( Dropping )
+    spool, headers = download( base + '/a.zip', tmp_path )
+    assert content( spool ) == BODY
+    assert spool.sha256.hexdigest() == revamp1804.hashlib.sha256( BODY ).hexdigest()
+    assert headers['ETag'] == '"v1"'
+    ( _, first ), ( _, second ) = server.requests
+    assert first.get( 'Range' ) is None
+    assert re.match( r'bytes=\d+-$', second['Range'] ) and second['If-Range'] == '"v1"'
+
+
+def test_whole_body_answer_to_a_resume_is_collected_anew( serve, tmp_path ):
+    base, server = serve( NotRanging )
+    spool, _ = download( base + '/a.zip', tmp_path )
+    assert content( spool ) == BODY
+    assert len( server.requests ) == 2
+
+
+def test_retry_after_a_retryable_status( serve, tmp_path ):
+    base, server = serve( Unavailable )
+    spool, _ = download( base + '/a.zip', tmp_path )
+    assert content( spool ) == BODY
+    assert len( server.requests ) == 2
+
+
+def test_status_error_is_not_retried( serve, tmp_path ):
+    base, server = serve( Missing )
+    with pytest.raises( HTTPStatusError ) as error:
+        download( base + '/a.zip', tmp_path )
+    assert error.value.code == 404
+    assert len( server.requests ) == 1
+
+
+def test_short_body_raises_incomplete_download_error( serve, tmp_path ):
+    base, server = serve( Short )
+    with pytest.raises( IncompleteDownloadError ) as error:
+        download( base + '/a.zip', tmp_path, retries=0 )
+    assert isinstance( error.value, DownloadError )
+    assert ( error.value.received, error.value.expected ) == ( 1000, len( BODY ) )
+    assert len( server.requests ) == 1
+    assert list( tmp_path.iterdir() ) == []     #no temporary file is left behind
@@ -0,0 +1,94 @@
+'''
+Tests of DownloadCache: revalidation of cached archives and eviction.
+'''
+import time
+
+import pytest
+
+import revamp1804
+from conftest import Handler
+from revamp1804 import CacheMissError, DownloadCache, Spool
+
+BODY = b'PK archive content'
+
+
+class Revalidating(Handler):
+    '''Serve BODY with an ETag; answer 304 to a matching If-None-Match.'''
+    def do_GET( self ):
+        self.record()
+        if self.headers.get( 'If-None-Match' ) == '"v1"':
+            self.send_body( 304, b'' )
+        else:
+            self.send_body( 200, BODY, [ ( 'ETag', '"v1"' ) ] )
+
+
+class Failing(Handler):
+    def do_GET( self ):
+        self.record()
+        self.send_body( 500, b'' )
+
+
+def stored( cache, url, body ):
+    '''Store "body" as the download of "url", as fetch() does.'''
+    cache.objects.mkdir( parents=True, exist_ok=True )
+    spool = Spool( cache.objects )
+    spool.write( body )
+    return cache.store( url, spool, {} )
+
+
+def test_fetch_revalidates_once_per_process( serve, tmp_path ):
+    base, server = serve( Revalidating )
+    url = base + '/theme.zip'
+    first = DownloadCache( root=tmp_path / 'downloads' )
+    path = first.fetch( url )
+    assert path.read_bytes() == BODY
+    assert first.fetch( url ) == path
+    assert len( server.requests ) == 1
+
+    #A new process revalidates the cached archive and is answered 304.
+    second = DownloadCache( root=tmp_path / 'downloads' )
+    assert second.fetch( url ) == path
+    assert len( server.requests ) == 2
+    assert server.requests[1][1].get( 'If-None-Match' ) == '"v1"'
+
+
+def test_fetch_falls_back_to_cached_copy_on_server_error( serve, tmp_path, monkeypatch ):
+    monkeypatch.setattr( revamp1804, 'DOWNLOAD_RETRIES', 0 )
+    base, server = serve( Failing )
+    url = base + '/theme.zip'
+    root = tmp_path / 'downloads'
+    path = stored( DownloadCache( root=root ), url, BODY )
+    assert DownloadCache( root=root ).fetch( url ) == path
+    assert len( server.requests ) == 1
+
+
+def test_offline_serves_only_cached_archives( tmp_path ):
+    root = tmp_path / 'downloads'
+    path = stored( DownloadCache( root=root ), 'http://example.invalid/a.zip', BODY )
+    offline = DownloadCache( root=root, offline=True )
+    assert offline.fetch( 'http://example.invalid/a.zip' ) == path
+    with pytest.raises( CacheMissError ):
+        offline.fetch( 'http://example.invalid/b.zip' )
+
+
+def test_evict_drops_least_recently_used_content( tmp_path, monkeypatch ):
+    clock = iter( range( 1000 ) )
+    monkeypatch.setattr( time, 'time', lambda: float( next( clock ) ) )
+    cache = DownloadCache( root=tmp_path / 'downloads', max_bytes=25 )
+    a = stored( cache, 'http://example.invalid/a.zip', b'a' * 10 )
+    b = stored( cache, 'http://example.invalid/b.zip', b'b' * 10 )
+    cache.fetch( 'http://example.invalid/a.zip' )    #a is now used after b
+    c = stored( cache, 'http://example.invalid/c.zip', b'c' * 10 )
+    assert a.is_file() and c.is_file()
+    assert not b.is_file()
+    assert cache.cached_sha256( 'http://example.invalid/b.zip' ) is None
+
+
+def test_evict_counts_shared_content_once( tmp_path ):
+    cache = DownloadCache( root=tmp_path / 'downloads', max_bytes=20 )
+    a = stored( cache, 'http://example.invalid/a.zip', b'x' * 10 )
+    mirror = stored( cache, 'http://mirror.invalid/a.zip', b'x' * 10 )
+    b = stored( cache, 'http://example.invalid/b.zip', b'b' * 10 )
+    assert a == mirror
+    assert a.is_file() and b.is_file()
+    assert cache.cached_sha256( 'http://mirror.invalid/a.zip' ) is not None